@@ -0,0 +1,476 @@
+import time
+import itertools
+import threading
+import multiprocessing
+import concurrent.futures
+
+from game import ServerDataInterface, ServerWorld
+from metrics import Histogram, MetricFamily
+from profiler import SamplingProfiler
+from protocol import attach_your_data, encode_player_state
+from snapshots import SnapshotHistory, WorldSnapshot, overlay_your_data
+from tick_scheduler import TickScheduler
+from world_commands import WorldCommandQueue
+
+
+#############################################################################
+
+# this starts the game arena. one world with its tick thread, snapshots and command queue
+
+#############################################################################
+
+def build_world(world_store_kind="objects", tick_rate=30):
+    # set world_store_kind to arrays to keep the world in numpy arrays and run the ticks vectorized,
+    # or to compact for world objects that update in place
+    if world_store_kind == "arrays":
+        from world_store import ArrayWorldToObjectsInterface, ArrayServerWorld
+        data_interface = ServerDataInterface(ArrayWorldToObjectsInterface())
+        server_world_class = ArrayServerWorld
+    elif world_store_kind == "compact":
+        from compact_world import CompactWorldToObjectsInterface
+        data_interface = ServerDataInterface(CompactWorldToObjectsInterface())
+        server_world_class = ServerWorld
+    else:
+        data_interface = ServerDataInterface()
+        server_world_class = ServerWorld
+    return data_interface, server_world_class(data_interface, tick_rate=tick_rate)
+
+
+class GameArena:
+    # the concurrency model: only the tick thread touches the world. changes are submitted as world commands,
+    # applied at the start of the next tick, and the world is read from the latest snapshot, which never changes.
+    # all requests return futures, so that an arena in another process can be used the same way
+    def __init__(self, world_store_kind="objects", tick_rate=30, interest_radius=None, interest_cells_per_radius=2):
+        self.tick_rate = tick_rate
+        self.data_interface, self.server_world = build_world(world_store_kind, tick_rate)
+        self.players_interface = self.data_interface.world_to_players_interface
+
+        # set interest_radius to send players only what is around them. the world is split into cells of
+        # interest_radius / interest_cells_per_radius, and players see the block of cells reaching
+        # interest_cells_per_radius cells out from their own. the block is shared by everyone in the cell, so it is
+        # a square, not a circle: it always covers interest_radius and reaches at most
+        # interest_radius * (1 + 1 / interest_cells_per_radius) along each axis.
+        # without it every player is sent the whole world
+        self.interest_cell_size = None if interest_radius is None else interest_radius / interest_cells_per_radius
+        self.interest_cell_radius = 0 if interest_radius is None else interest_cells_per_radius
+
+        # every tick ends with a snapshot of the world, so clients can be sent what changed since their last update
+        self.snapshot_history = SnapshotHistory()
+        self.snapshot_history.record(self.capture_snapshot())
+
+        self.world_commands = WorldCommandQueue()
+        self.commands = {"add_player": self.players_interface.add_player_by_name,
+                         "remove_player": self.players_interface.remove_player_by_name,
+                         "update_player": self.apply_client_data,
+                         "shoot_bullet": self.shoot_player_bullet,
+                         "queue_player_inputs": self.players_interface.queue_player_inputs,
+                         "get_player_state": self.encode_player_state_by_name}
+
+        # run the world at a fixed tick rate
+        self.tick_scheduler = TickScheduler(self.run_tick, tick_rate=tick_rate)
+
+        # world updates that are not encoded yet are built here, never on the thread asking for them
+        self.world_data_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2,
+                                                                         thread_name_prefix="world_data")
+
+        # metrics. how long each phase of a tick takes, and what the world data sent to each client costs
+        self.phase_duration_ms = MetricFamily(["phase"], lambda: Histogram([0.1, 0.5, 1, 2, 5, 10, 20, 33, 100]))
+        self.world_data_build_ms = MetricFamily(["wire_format"],
+                                                lambda: Histogram([0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50]))
+        self.world_data_bytes = MetricFamily(["wire_format"],
+                                             lambda: Histogram([64, 256, 1024, 4096, 16384, 65536, 262144]))
+
+    def start(self):
+        return self.tick_scheduler.start()
+
+    def stop(self):
+        self.tick_scheduler.stop()
+        self.world_data_executor.shutdown(wait=False)
+
+    def run_tick(self):
+        tick_start_time = time.perf_counter()
+        completed_commands = self.world_commands.apply_pending()
+        commands_applied_time = time.perf_counter()
+        try:
+            self.server_world.update()
+            world_updated_time = time.perf_counter()
+            self.snapshot_history.record(self.capture_snapshot())
+        except Exception as error:
+            # the change a command made may never be snapshotted. fail its future rather than leave
+            # the handler waiting, and the same for everything queued behind it.
+            # the error is wrapped so that it always pickles back from an arena process
+            tick_error = RuntimeError(f"Tick {self.server_world.get_current_tick()} failed: {error!r}")
+            self.world_commands.resolve([(future, None, tick_error) for future, _, _ in completed_commands])
+            self.world_commands.fail_pending(tick_error)
+            raise
+        self.world_commands.resolve(completed_commands)
+
+        phase_duration_ms = self.phase_duration_ms
+        phase_duration_ms.labels("world_commands").observe((commands_applied_time - tick_start_time) * 1000)
+        for phase_name, phase_duration in self.server_world.phase_durations.items():
+            phase_duration_ms.labels(phase_name).observe(phase_duration * 1000)
+        phase_duration_ms.labels("snapshot").observe((time.perf_counter() - world_updated_time) * 1000)
+
+    def capture_snapshot(self):
+        return WorldSnapshot.capture(self.data_interface, self.interest_cell_size, self.interest_cell_radius)
+
+    # world commands. these run on the tick thread
+    def apply_client_data(self, client_data: dict):
+        # for now client sends safe data and not pickled objects for server security
+        # pickled objects can contain malicious cose [WARNING]
+        # the server is authoritative. battleship state sent by older clients is ignored, only the colour is kept
+        return self.players_interface.update_player(client_data["client_name"], {"color": client_data["player_color"]})
+
+    def shoot_player_bullet(self, player_name: str):
+        player = self.players_interface.get_player_by_name(player_name)
+        if player is not None:
+            player.world_battleship.shoot_bullet()
+            return 1
+        return 0
+
+    def encode_player_state_by_name(self, player_name: str):
+        # the player state in the binary wire format
+        player_object = self.players_interface.get_player_by_name(player_name)
+        if player_object is not None:
+            return encode_player_state(player_object)
+        return None
+
+    # snapshot readers. these run on the caller's thread
+    def build_your_data(self, player_name: str, latest_snapshot: WorldSnapshot):
+        # check if player is killed due to bullet collision. then return the same data for client to reflect it.
+        # live players also get their own battleship state, so that the client can reconcile its prediction
+        player_state = latest_snapshot.player_states.get(player_name)
+        if player_state is None:
+            return {"killed": True}
+        return {"killed": False, **player_state}
+
+    def encode_world_data_for_client(self, player_name: str, last_tick: int | None, wire_format: str):
+        start_time = time.perf_counter()
+        tick, encoded_world_data = self.build_world_data_for_client(player_name, last_tick, wire_format)
+        self.world_data_build_ms.labels(wire_format).observe((time.perf_counter() - start_time) * 1000)
+        self.world_data_bytes.labels(wire_format).observe(len(encoded_world_data))
+        return tick, encoded_world_data
+
+    def build_world_data_for_client(self, player_name: str, last_tick: int | None, wire_format: str):
+        # the payload is encoded once per tick and shared by all clients with the same view. its
+        # opponent_player_data includes the requesting player, clients drop their own entry
+        snapshot_history = self.snapshot_history
+        latest_snapshot = snapshot_history.latest_snapshot
+        your_data = self.build_your_data(player_name, latest_snapshot)
+
+        if wire_format == "binary":
+            encoded_world_data = snapshot_history.build_update(acknowledged_tick=last_tick, wire_format="binary",
+                                                               latest_snapshot=latest_snapshot,
+                                                               player_name=player_name)
+            return latest_snapshot.tick, attach_your_data(encoded_world_data, your_data)
+
+        if last_tick is None:
+            encoded_world_data = latest_snapshot.get_encoded_world_data(latest_snapshot.get_player_cell(player_name))
+        else:
+            encoded_world_data = snapshot_history.build_update(acknowledged_tick=last_tick,
+                                                               latest_snapshot=latest_snapshot,
+                                                               player_name=player_name)
+        return latest_snapshot.tick, overlay_your_data(encoded_world_data, your_data)
+
+    def get_stats(self):
+        tick_stats = self.tick_scheduler.get_stats()
+        tick_stats["world_tick"] = self.server_world.get_current_tick()
+        tick_stats["players"] = len(self.snapshot_history.latest_snapshot.players)
+        tick_stats["bullets"] = len(self.snapshot_history.latest_snapshot.bullets)
+        tick_stats["bullet_pool"] = self.data_interface.world_to_objects_interface.bullet_pool.get_stats()
+        tick_stats["world_commands"] = self.world_commands.get_stats()
+        tick_stats["phase_duration_ms"] = self.phase_duration_ms.to_dict()
+        tick_stats["world_data_build_ms"] = self.world_data_build_ms.to_dict()
+        tick_stats["world_data_bytes"] = self.world_data_bytes.to_dict()
+        return tick_stats
+
+    # requests. the same for an arena in this process and one in an arena process
+    def submit_command(self, command_name, *args) -> concurrent.futures.Future:
+        # resolved after the tick that applied the command
+        return self.world_commands.submit(self.commands[command_name], *args)
+
+    def request_world_data(self, player_name, last_tick, wire_format, only_if_newer=False) -> concurrent.futures.Future:
+        # resolves to (tick, encoded world data). with only_if_newer it resolves to None
+        # when nothing was ticked after last_tick.
+        # updates already encoded for this tick are answered straight away, the rest go to the world data executor
+        latest_snapshot = self.snapshot_history.latest_snapshot
+        if only_if_newer and latest_snapshot.tick == last_tick:
+            future = concurrent.futures.Future()
+            future.set_result(None)
+            return future
+
+        if wire_format == "json" and last_tick is None:
+            is_encoded = latest_snapshot.get_player_cell(player_name) in latest_snapshot.encoded_world_data
+        else:
+            is_encoded = self.snapshot_history.is_update_encoded(last_tick, wire_format, latest_snapshot, player_name)
+        if not is_encoded:
+            return self.world_data_executor.submit(self.encode_world_data_for_client, player_name, last_tick,
+                                                   wire_format)
+        future = concurrent.futures.Future()
+        future.set_result(self.encode_world_data_for_client(player_name, last_tick, wire_format))
+        return future
+
+    def request_stats(self) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        future.set_result(self.get_stats())
+        return future
+
+    def request_player_names(self) -> concurrent.futures.Future:
+        # the players in the latest snapshot
+        future = concurrent.futures.Future()
+        future.set_result(set(self.snapshot_history.latest_snapshot.players))
+        return future
+
+
+#############################################################################
+
+# this starts the arena processes. each runs one arena and answers requests over a pipe
+
+#############################################################################
+
+def run_arena_process(connection, world_store_kind, tick_rate, interest_radius=None):
+    # the main loop of an arena process. requests are (request id, request type, arguments),
+    # every request is answered with (request id, succeeded, result or error)
+    game_arena = GameArena(world_store_kind, tick_rate, interest_radius)
+    game_arena.start()
+
+    # the server's profiler only sees its own process. this one is toggled through profiler requests
+    sampling_profiler = SamplingProfiler()
+
+    # command futures are resolved on the tick thread, so replies can come from two threads
+    send_lock = threading.Lock()
+
+    def reply(request_id, future: concurrent.futures.Future):
+        error = future.exception()
+        with send_lock:
+            if error is None:
+                connection.send((request_id, True, future.result()))
+            else:
+                connection.send((request_id, False, error))
+
+    try:
+        while True:
+            request_id, request_type, args = connection.recv()
+            if request_type == "stop":
+                break
+            if request_type == "command":
+                future = game_arena.submit_command(*args)
+            elif request_type == "world_data":
+                future = game_arena.request_world_data(*args)
+            elif request_type == "player_names":
+                future = game_arena.request_player_names()
+            elif request_type == "profiler":
+                future = concurrent.futures.Future()
+                try:
+                    future.set_result(sampling_profiler.handle_request(*args))
+                except Exception as error:
+                    future.set_exception(error)
+            else:
+                future = game_arena.request_stats()
+            future.add_done_callback(lambda done_future, request_id_v=request_id: reply(request_id_v, done_future))
+    except (EOFError, KeyboardInterrupt):
+        # the server went away, or is shutting down together with us
+        pass
+    finally:
+        sampling_profiler.stop()
+        game_arena.stop()
+
+
+class ArenaProcess:
+    # stands in for a GameArena that runs in its own process, so that arenas tick on separate cores
+    def __init__(self, world_store_kind="objects", tick_rate=30, interest_radius=None):
+        # spawn, not fork. the server already runs threads that a forked child would inherit half way
+        process_context = multiprocessing.get_context("spawn")
+        self.connection, child_connection = process_context.Pipe()
+        self.process = process_context.Process(target=run_arena_process,
+                                               args=(child_connection, world_store_kind, tick_rate, interest_radius),
+                                               daemon=True)
+
+        self._request_id_counter = itertools.count(1)
+        self.pending_requests: dict[int, concurrent.futures.Future] = {}
+        # set once the arena process is gone. requests after that fail straight away with it
+        self.exit_error: ConnectionError | None = None
+        self.send_lock = threading.Lock()
+        self.receiver_thread = threading.Thread(target=self.receive_replies, daemon=True)
+
+    def start(self):
+        self.process.start()
+        self.receiver_thread.start()
+
+    def stop(self):
+        self.send_request("stop")
+        self.process.join(timeout=5)
+
+    def receive_replies(self):
+        try:
+            while True:
+                request_id, succeeded, result = self.connection.recv()
+                future = self.pending_requests.pop(request_id)
+                try:
+                    if succeeded:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(result)
+                except concurrent.futures.InvalidStateError:
+                    # the caller gave up waiting and cancelled the future
+                    pass
+        except (EOFError, OSError) as error:
+            # the arena process is gone. fail whatever is still waiting on it
+            self.mark_exited(error)
+
+    def mark_exited(self, error):
+        if self.exit_error is None:
+            self.exit_error = ConnectionError(f"Arena process has exited: {error!r}")
+        for request_id in list(self.pending_requests):
+            self.fail_request(self.pending_requests.pop(request_id, None), self.exit_error)
+
+    @staticmethod
+    def fail_request(future: concurrent.futures.Future | None, error):
+        if future is None or future.done():
+            return
+        try:
+            future.set_exception(error)
+        except concurrent.futures.InvalidStateError:
+            # cancelled between the check and the call
+            pass
+
+    def send_request(self, request_type, *args) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        if self.exit_error is not None:
+            future.set_exception(self.exit_error)
+            return future
+
+        request_id = next(self._request_id_counter)
+        self.pending_requests[request_id] = future
+        try:
+            with self.send_lock:
+                self.connection.send((request_id, request_type, args))
+        except OSError as error:
+            self.mark_exited(error)
+        # the receiver may have failed the pending requests before this one was added
+        if self.exit_error is not None:
+            self.fail_request(self.pending_requests.pop(request_id, None), self.exit_error)
+        return future
+
+    def submit_command(self, command_name, *args) -> concurrent.futures.Future:
+        return self.send_request("command", command_name, *args)
+
+    def request_world_data(self, player_name, last_tick, wire_format, only_if_newer=False) -> concurrent.futures.Future:
+        return self.send_request("world_data", player_name, last_tick, wire_format, only_if_newer)
+
+    def request_stats(self) -> concurrent.futures.Future:
+        return self.send_request("stats")
+
+    def request_player_names(self) -> concurrent.futures.Future:
+        return self.send_request("player_names")
+
+    def request_profiler(self, action, limit=None) -> concurrent.futures.Future:
+        # drives the sampling profiler of the arena process. see SamplingProfiler.handle_request
+        return self.send_request("profiler", action, limit)
+
+
+#############################################################################
+
+# this starts the arena manager. it matches players to arenas and remembers which arena owns which player
+
+#############################################################################
+
+class ArenaManager:
+    # arenas are GameArena or ArenaProcess instances. player names are unique across all arenas.
+    # max_players_per_arena None puts no cap on arenas.
+    # players killed in their arena are never told to the manager. a sweep thread asks every arena
+    # who is still in its world and releases the slots of joined players that are gone
+    def __init__(self, arenas: list, max_players_per_arena=50, sweep_interval=1.0):
+        self.arenas = arenas
+        self.max_players_per_arena = max_players_per_arena
+        self.sweep_interval = sweep_interval
+
+        self.player_arenas: dict[str, int] = {}
+        self.arena_player_counts = [0] * len(arenas)
+        # players known to be in their world, with the id of that join. players still joining are not swept
+        self.joined_players: dict[str, int] = {}
+        self._join_id_counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def start(self):
+        for arena in self.arenas:
+            arena.start()
+        threading.Thread(target=self.run_sweeps, name="arena_sweep", daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+        for arena in self.arenas:
+            arena.stop()
+
+    def assign_arena(self, player_name):
+        # matchmaking. new players join the busiest arena that still has room, so matches fill up
+        # before a new one is started. returns None if the name is taken or every arena is full
+        with self._lock:
+            if player_name in self.player_arenas:
+                return None
+            open_arenas = [arena_index for arena_index, player_count in enumerate(self.arena_player_counts)
+                           if self.max_players_per_arena is None or player_count < self.max_players_per_arena]
+            if not open_arenas:
+                return None
+            arena_index = max(open_arenas, key=lambda open_arena_index: self.arena_player_counts[open_arena_index])
+            self.player_arenas[player_name] = arena_index
+            self.arena_player_counts[arena_index] += 1
+            return arena_index
+
+    def confirm_player(self, player_name):
+        # the player is in the latest snapshot of its arena. from now on it is swept once it leaves the world
+        with self._lock:
+            if player_name in self.player_arenas:
+                self.joined_players[player_name] = next(self._join_id_counter)
+
+    def release_player(self, player_name):
+        with self._lock:
+            self.joined_players.pop(player_name, None)
+            arena_index = self.player_arenas.pop(player_name, None)
+            if arena_index is not None:
+                self.arena_player_counts[arena_index] -= 1
+
+    def get_arena(self, player_name):
+        # the arena that owns the player, None for unknown players
+        arena_index = self.player_arenas.get(player_name)
+        return None if arena_index is None else self.arenas[arena_index]
+
+    def get_arena_player_counts(self):
+        return list(self.arena_player_counts)
+
+    def sweep_arena(self, arena_index, timeout=5.0):
+        # the joined players are taken before the arena is asked, so everyone in them was already in a snapshot
+        # the arena answers from. a player who left and joined again since has a new join id and is kept
+        with self._lock:
+            joined_players = {player_name: join_id for player_name, join_id in self.joined_players.items()
+                              if self.player_arenas[player_name] == arena_index}
+        if not joined_players:
+            return 0
+        player_names_in_world = self.arenas[arena_index].request_player_names().result(timeout=timeout)
+
+        released_count = 0
+        with self._lock:
+            for player_name, join_id in joined_players.items():
+                if player_name not in player_names_in_world and self.joined_players.get(player_name) == join_id:
+                    del self.joined_players[player_name]
+                    del self.player_arenas[player_name]
+                    self.arena_player_counts[arena_index] -= 1
+                    released_count += 1
+        return released_count
+
+    def run_sweeps(self):
+        while not self._stop_event.wait(self.sweep_interval):
+            for arena_index in range(len(self.arenas)):
+                try:
+                    self.sweep_arena(arena_index)
+                except Exception as error:
+                    # an arena that does not answer is tried again at the next sweep
+                    print(f"[WARNING] (ARENAS) - sweep of arena {arena_index} failed: {error!r}")
+
+
+def build_arenas(number_of_arenas=1, world_store_kind="objects", tick_rate=30, interest_radius=None):
+    # a single arena runs in the server process. more arenas get a process each
+    if number_of_arenas <= 1:
+        return [GameArena(world_store_kind, tick_rate, interest_radius)]
+    return [ArenaProcess(world_store_kind, tick_rate, interest_radius) for _ in range(number_of_arenas)]
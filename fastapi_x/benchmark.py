@@ -0,0 +1,327 @@
+import gc
+import io
+import json
+import math
+import time
+import random
+import argparse
+import datetime
+import contextlib
+import statistics
+import subprocess
+import tracemalloc
+
+from game import ServerDataInterface, ServerWorld
+
+
+#############################################################################
+
+# this starts the world setup helpers
+
+#############################################################################
+
+ARENA_WIDTH, ARENA_HEIGHT = (800, 600)
+
+
+def get_arena_size(number_of_players):
+    # the arena grows with the player count so that the player density matches 10 players on one screen
+    arena_scale = math.sqrt(max(number_of_players, 10) / 10)
+    return ARENA_WIDTH * arena_scale, ARENA_HEIGHT * arena_scale
+
+
+WORLD_STORES = ["objects", "compact", "arrays"]
+
+
+def build_data_interface(store="objects"):
+    if store == "arrays":
+        from world_store import ArrayWorldToObjectsInterface
+        return ServerDataInterface(ArrayWorldToObjectsInterface())
+    if store == "compact":
+        from compact_world import CompactWorldToObjectsInterface
+        return ServerDataInterface(CompactWorldToObjectsInterface())
+    return ServerDataInterface()
+
+
+def build_server_world(data_interface, number_of_players, store="objects"):
+    if store == "arrays":
+        from world_store import ArrayServerWorld
+        return ArrayServerWorld(data_interface, arena_size=get_arena_size(number_of_players))
+    return ServerWorld(data_interface, arena_size=get_arena_size(number_of_players))
+
+
+def build_world(number_of_players, seed=0, store="objects", bullets_per_player=None):
+    # populate a world with players scattered over the arena, each having fired bullets_per_player bullets,
+    # or all of its bullets
+    random_generator = random.Random(seed)
+    arena_width, arena_height = get_arena_size(number_of_players)
+    data_interface = build_data_interface(store)
+    players_interface = data_interface.world_to_players_interface
+
+    # the world prints on every add. keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for player_index in range(number_of_players):
+            players_interface.add_player_by_name(f"bot_{player_index}")
+
+        for player_o in players_interface.get_all_players():
+            battleship_o = player_o.world_battleship
+            battleship_o.position = [random_generator.uniform(0, arena_width),
+                                     random_generator.uniform(0, arena_height)]
+            bullets_to_fire = battleship_o.bullets_left if bullets_per_player is None else bullets_per_player
+            for _ in range(min(bullets_to_fire, battleship_o.bullets_left)):
+                battleship_o.angle = random_generator.uniform(0, 360)
+                battleship_o.shoot_bullet()
+
+        # fly the bullets clear of their own ship and backdate them,
+        # so that they are eligible for collision checks straight away
+        for bullet_o in data_interface.world_to_objects_interface.get_bullets(get_only_activated=True):
+            for _ in range(5):
+                bullet_o.move()
+            bullet_o.activation_tick -= 30
+
+    return data_interface
+
+
+#############################################################################
+
+# this starts the benchmarks
+
+#############################################################################
+
+def benchmark_ticks(number_of_players, number_of_ticks=100, seed=0, store="objects"):
+    data_interface = build_world(number_of_players, seed=seed, store=store)
+    server_world = build_server_world(data_interface, number_of_players, store)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        for _ in range(number_of_ticks):
+            server_world.update()
+        elapsed_time = time.perf_counter() - start_time
+
+        players_left = len(data_interface.world_to_players_interface.get_all_players())
+
+        # tear the world down here, so that the removal prints of __del__ do not leak out at exit
+        del data_interface, server_world
+        gc.collect()
+
+    return {"players": number_of_players,
+            "players_left": players_left,
+            "ticks_per_second": number_of_ticks / elapsed_time if elapsed_time > 0 else math.inf}
+
+
+def benchmark_memory(number_of_players, seed=0, store="objects"):
+    # memory held by a freshly built world, and what one tick allocates on top of it.
+    # an empty world is built first so that module imports are not counted
+    build_data_interface(store)
+    gc.collect()
+    tracemalloc.start()
+    data_interface = build_world(number_of_players, seed=seed, store=store)
+    world_bytes, _ = tracemalloc.get_traced_memory()
+
+    server_world = build_server_world(data_interface, number_of_players, store)
+    with contextlib.redirect_stdout(io.StringIO()):
+        server_world.update()
+        tracemalloc.reset_peak()
+        before_tick_bytes, _ = tracemalloc.get_traced_memory()
+        server_world.update()
+        _, peak_tick_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        del data_interface, server_world
+        gc.collect()
+
+    return {"players": number_of_players,
+            "world_kib": world_bytes / 1024,
+            "bytes_per_player": world_bytes / number_of_players,
+            "tick_peak_kib": (peak_tick_bytes - before_tick_bytes) / 1024}
+
+
+#############################################################################
+
+# this starts the hot path suite. its results can be recorded to a history file and compared run to run
+
+#############################################################################
+
+SUITE_SIZES = [10, 100, 1000, 10000]
+# binary world updates count entities in uint16. 10000 players with a full magazine in flight would not fit
+SUITE_BULLETS_PER_PLAYER = 5
+SUITE_TIMED_TICKS = 10
+
+
+def time_calls(operation, repeats, setup=None):
+    # the fastest call in microseconds, like timeit. slower calls were held up by something else
+    # on the machine, which is the noise a run to run comparison has to leave out.
+    # setup runs before every call and is not timed
+    durations = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            if setup is not None:
+                setup()
+            start_time = time.perf_counter()
+            operation()
+            durations.append(time.perf_counter() - start_time)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return min(durations) * 1e6
+
+
+def get_suite_repeats(number_of_players):
+    # fewer repeats for the big worlds, where a single call is long enough to time well
+    return max(5, min(200, 20000 // number_of_players))
+
+
+def benchmark_hot_paths(number_of_players, seed=0, store="objects"):
+    # microseconds per call of each hot path, in a world of number_of_players players with their bullets flying
+    from snapshots import SnapshotHistory, WorldSnapshot
+
+    repeats = get_suite_repeats(number_of_players)
+    data_interface = build_world(number_of_players, seed=seed, store=store,
+                                 bullets_per_player=SUITE_BULLETS_PER_PLAYER)
+    server_world = build_server_world(data_interface, number_of_players, store)
+    players_interface = data_interface.world_to_players_interface
+    results = {}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # collisions and spent bullets. the first call removes the players hit,
+        # the fastest call is then one on the world it settles into
+        results["enforce_environment_constraints"] = time_calls(server_world.enforce_environment_constraints, repeats)
+        # bullets expire and leave the arena as the world ticks, so only the first few ticks are timed
+        results["update"] = time_calls(server_world.update, min(repeats, SUITE_TIMED_TICKS))
+
+        # joins and leaves, one player at a time in the populated world
+        joiner_names = iter(f"joiner_{joiner_index}" for joiner_index in range(repeats))
+        joined_names = []
+
+        def add_player():
+            joined_names.append(next(joiner_names))
+            players_interface.add_player_by_name(joined_names[-1])
+
+        results["add_player_by_name"] = time_calls(add_player, repeats)
+        results["remove_player_by_name"] = time_calls(lambda: players_interface.remove_player_by_name(
+            joined_names.pop()), repeats)
+
+        # world data serialization. what one tick costs the tick thread, then the updates sent to clients.
+        # the encoded updates are cleared before every call, so each call encodes
+        previous_snapshot = WorldSnapshot.capture(data_interface)
+        server_world.update()
+        results["snapshot_capture"] = time_calls(lambda: WorldSnapshot.capture(data_interface), repeats)
+        latest_snapshot = WorldSnapshot.capture(data_interface)
+        snapshot_history = SnapshotHistory()
+        snapshot_history.record(previous_snapshot)
+        snapshot_history.record(latest_snapshot)
+        for wire_format in ("json", "binary"):
+            for update_kind, acknowledged_tick in (("keyframe", None), ("delta", previous_snapshot.tick)):
+                results[f"{wire_format}_{update_kind}"] = time_calls(
+                    lambda: snapshot_history.build_update(acknowledged_tick, wire_format, latest_snapshot), repeats,
+                    setup=latest_snapshot.encoded_updates.clear)
+
+        del data_interface, server_world, players_interface, previous_snapshot, latest_snapshot, snapshot_history
+        gc.collect()
+
+    return results
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_suite_baseline(history_path, baseline_runs=5):
+    # the median result of the last baseline_runs runs in the history file, per result key.
+    # a single earlier run may have been on a busy machine
+    try:
+        with open(history_path) as history_file:
+            recorded_runs = [json.loads(line) for line in history_file if line.strip()][-baseline_runs:]
+    except FileNotFoundError:
+        return {}
+
+    recorded_results: dict[str, list[float]] = {}
+    for recorded_run in recorded_runs:
+        for result_key, microseconds in recorded_run["results"].items():
+            recorded_results.setdefault(result_key, []).append(microseconds)
+    return {result_key: statistics.median(values) for result_key, values in recorded_results.items()}
+
+
+def run_suite(sizes, stores, history_path=None, regression_threshold=0.25, baseline_runs=5):
+    # returns the table rows and the number of regressions. with a history path, every row is compared to
+    # the recent runs recorded there, and this run is appended. results are keyed "store/hot path/players"
+    baseline_results = read_suite_baseline(history_path, baseline_runs) if history_path else {}
+
+    rows, results, regression_count = [], {}, 0
+    for store in stores:
+        for number_of_players in sizes:
+            for hot_path, microseconds in benchmark_hot_paths(number_of_players, store=store).items():
+                result_key = f"{store}/{hot_path}/{number_of_players}"
+                results[result_key] = microseconds
+                row = {"store": store, "hot_path": hot_path, "players": number_of_players, "us": microseconds,
+                       "baseline_us": "-", "change_pct": "-"}
+                if result_key in baseline_results:
+                    change = microseconds / baseline_results[result_key] - 1 if baseline_results[result_key] else 0.0
+                    row.update({"baseline_us": baseline_results[result_key], "change_pct": 100 * change})
+                    if change > regression_threshold:
+                        row["change_pct"] = f"{100 * change:.1f} !"
+                        regression_count += 1
+                rows.append(row)
+
+    if history_path:
+        with open(history_path, "a") as history_file:
+            history_file.write(json.dumps({"recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                                           "commit": get_git_commit(),
+                                           "results": results}) + "\n")
+    return rows, regression_count
+
+
+def print_table(rows, columns):
+    print(" | ".join(f"{column:>16}" for column in columns))
+    print("-" * (19 * len(columns)))
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row[column]
+            cells.append(f"{value:>16.1f}" if isinstance(value, float) else f"{value:>16}")
+        print(" | ".join(cells))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the server world simulation")
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+    parser.add_argument("--ticks", type=int, default=100)
+    parser.add_argument("--store", choices=WORLD_STORES, nargs="+", default=["objects"],
+                        help="world stores to compare. arrays needs numpy")
+    parser.add_argument("--memory", action="store_true", help="measure world memory instead of tick throughput")
+    parser.add_argument("--suite", action="store_true",
+                        help="time each hot path at --sizes players instead of whole ticks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SUITE_SIZES)
+    parser.add_argument("--history", default=None,
+                        help="json lines file of earlier suite runs. this run is compared to them and added")
+    parser.add_argument("--regression-threshold", type=float, default=0.25,
+                        help="slowdown against recent runs that counts as a regression. 0.25 is 25 percent")
+    parser.add_argument("--baseline-runs", type=int, default=5,
+                        help="how many recent runs of the history make up the baseline")
+    args = parser.parse_args()
+
+    if args.suite:
+        print(f"[INFO] (BENCHMARK) - hot path microseconds per call against player count")
+        suite_rows, regression_count_v = run_suite(args.sizes, args.store, args.history,
+                                                    args.regression_threshold, args.baseline_runs)
+        print_table(suite_rows, ["store", "hot_path", "players", "us", "baseline_us", "change_pct"])
+        if regression_count_v:
+            print(f"[WARNING] (BENCHMARK) - {regression_count_v} hot paths are more than "
+                  f"{100 * args.regression_threshold:.0f} percent slower than recent runs")
+            raise SystemExit(1)
+        raise SystemExit(0)
+
+    for store_v in args.store:
+        if args.memory:
+            print(f"[INFO] (BENCHMARK) - world memory against player count, {store_v} store")
+            results = [benchmark_memory(player_count, store=store_v) for player_count in args.players]
+            print_table(results, ["players", "world_kib", "bytes_per_player", "tick_peak_kib"])
+        else:
+            print(f"[INFO] (BENCHMARK) - ServerWorld.update ticks/sec against player count, {store_v} store")
+            results = [benchmark_ticks(player_count, args.ticks, store=store_v) for player_count in args.players]
+            print_table(results, ["players", "players_left", "ticks_per_second"])
@@ -0,0 +1,43 @@
+import random
+
+
+#############################################################################
+
+# this starts the bot pilots for headless players. no pygame needed, so swarms can import it too
+
+#############################################################################
+
+# script words for headless players, as (thrust, rotate, shoot)
+BOT_SCRIPT_INPUTS = {"thrust": (1, 0, False), "brake": (-1, 0, False), "left": (0, -1, False),
+                     "right": (0, 1, False), "shoot": (0, 0, True), "idle": (0, 0, False)}
+
+
+def parse_bot_script(script_text):
+    # "thrust,thrust,left,shoot" -> the inputs, played in a loop
+    bot_script = []
+    for word in script_text.split(","):
+        word = word.strip()
+        if not word:
+            continue
+        if word not in BOT_SCRIPT_INPUTS:
+            raise ValueError(f"unknown bot script word {word!r}, expected one of {', '.join(BOT_SCRIPT_INPUTS)}")
+        bot_script.append(BOT_SCRIPT_INPUTS[word])
+    return bot_script
+
+
+class BotPilot:
+    # stands in for the keyboard of a headless player. plays a script of (thrust, rotate, shoot) inputs
+    # in a loop, or picks random inputs without one
+    def __init__(self, script=None, seed=None, shoot_chance=0.1):
+        self.script = list(script) if script else None
+        self.script_index = 0
+        self.random = random.Random(seed)
+        self.shoot_chance = shoot_chance
+
+    def next_input(self):
+        if self.script is not None:
+            player_input = self.script[self.script_index % len(self.script)]
+            self.script_index += 1
+            return player_input
+        return (self.random.choice((-1, 0, 0, 1)), self.random.choice((-1, 0, 0, 1)),
+                self.random.random() < self.shoot_chance)
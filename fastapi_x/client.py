@@ -1,68 +1,582 @@
+import json
 import time
-import pickle
+import struct
+import queue
+import collections
+import threading
 import pygame
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import argparse
 
-from game import Player, WorldBattleship, WorldToObjectsInterface
+from bots import BOT_SCRIPT_INPUTS, BotPilot, parse_bot_script
+from game import Player, WorldBattleship, WorldToObjectsInterface, WorldToPlayersInterface
+from protocol import ANGLE_SCALE, BINARY_MEDIA_TYPE, decode_player_state, decode_world_update
+
+
+class TimedSnapshot:
+    # a world state as received from the server, stamped with the server tick it describes
+    def __init__(self, tick, opponents: dict, bullets: dict):
+        self.tick = tick
+        self.opponents = opponents
+        self.bullets = bullets
 
 
 class DataCache:
 
-    def __init__(self):
+    def __init__(self, player_name=None, server_tick_rate=30, interpolation_delay=0.25, snapshot_buffer_size=16):
         self.world_data = None
 
+        # the server sends the same world payload to everyone. our own entry is dropped from the opponents
+        self.player_name = player_name
+
+        # world state rebuilt from the tick numbered updates of the server.
+        # an unknown tick (-1) makes the server send a full keyframe
+        self.last_tick = -1
+        self.opponents = {}
+        self.bullets = {}
+
+        # updates are written from network threads. the render loop only ever reads world_data,
+        # which is swapped in as a whole so it never sees a half applied update
+        self.update_lock = threading.Lock()
+
+        # recent world states for smooth rendering between server updates. opponents are drawn
+        # interpolation_delay seconds in the past, between the two snapshots around that time.
+        # bullets are extrapolated from the newest snapshot with their velocity (units per server tick)
+        self.server_tick_rate = server_tick_rate
+        self.interpolation_delay = interpolation_delay
+        self.snapshot_buffer: collections.deque[TimedSnapshot] = collections.deque(maxlen=snapshot_buffer_size)
+        # local time of server tick 0. the smallest offset seen is the one least delayed by the network
+        self.server_clock_offset = None
+
+        # failures of the network threads. they keep running, so a rising count means the world shown is stale
+        self.network_error_count = 0
+        self.last_network_error = None
+
+    def record_network_error(self, error):
+        self.network_error_count += 1
+        self.last_network_error = error
+        print(f"[WARNING] (NETWORK) - {error!r}")
+
     def update_world_data(self, world_data):
+        world_data["opponent_player_data"].pop(self.player_name, None)
         self.world_data = world_data
 
+    def apply_world_update(self, world_update):
+        with self.update_lock:
+            # a keyframe replaces the state, any other update only carries what changed since last_tick
+            if world_update["keyframe"]:
+                self.opponents, self.bullets = {}, {}
+
+            self.opponents.update(world_update["opponent_player_data"])
+            for opponent_name in world_update["removed_opponents"]:
+                self.opponents.pop(opponent_name, None)
+
+            # json turns the bullet ids into strings
+            self.bullets.update(world_update["bullets"])
+            for bullet_id in world_update["removed_bullets"]:
+                self.bullets.pop(str(bullet_id), None)
+
+            self.last_tick = world_update["tick"]
+            self.record_snapshot(world_update["tick"], time.time())
+            self.update_world_data({"opponent_player_data": dict(self.opponents),
+                                    "world_objects_data": {"bullets": [bullet_data[:2] for bullet_data
+                                                                       in self.bullets.values()]},
+                                    "distant_summary": world_update["distant_summary"],
+                                    "your_data": world_update["your_data"],
+                                    "tick": world_update["tick"]})
+
+    def record_snapshot(self, tick, receive_time):
+        clock_offset = receive_time - tick / self.server_tick_rate
+        if self.server_clock_offset is None or clock_offset < self.server_clock_offset:
+            self.server_clock_offset = clock_offset
+
+        opponents = dict(self.opponents)
+        opponents.pop(self.player_name, None)
+        self.snapshot_buffer.append(TimedSnapshot(tick, opponents, dict(self.bullets)))
+
+    def get_tick_time(self, tick):
+        # local time at which the server finished the given tick
+        return tick / self.server_tick_rate + self.server_clock_offset
+
+    def get_snapshot_time(self, snapshot: TimedSnapshot):
+        return self.get_tick_time(snapshot.tick)
+
+    def get_render_state(self, current_time):
+        # returns the opponents (as in opponent_player_data) and bullet positions to draw at current_time
+        with self.update_lock:
+            snapshots = list(self.snapshot_buffer)
+        if not snapshots:
+            return {}, []
+
+        # find the two snapshots around the render time. before the first or after the last one, hold still
+        render_time = current_time - self.interpolation_delay
+        older_snapshot = newer_snapshot = snapshots[-1]
+        for snapshot in reversed(snapshots):
+            older_snapshot = snapshot
+            if self.get_snapshot_time(snapshot) <= render_time:
+                break
+            newer_snapshot = snapshot
+
+        older_time, newer_time = self.get_snapshot_time(older_snapshot), self.get_snapshot_time(newer_snapshot)
+        fraction = 1.0
+        if newer_time > older_time:
+            fraction = min(max((render_time - older_time) / (newer_time - older_time), 0.0), 1.0)
+
+        opponents = {}
+        for opponent_name, newer_data in newer_snapshot.opponents.items():
+            older_data = older_snapshot.opponents.get(opponent_name, newer_data)
+            (old_x, old_y), (new_x, new_y) = older_data["battleship_position"], newer_data["battleship_position"]
+            opponents[opponent_name] = {"name": opponent_name,
+                                        "battleship_position": [old_x + (new_x - old_x) * fraction,
+                                                                old_y + (new_y - old_y) * fraction],
+                                        "color": newer_data["color"]}
+
+        # bullets are drawn where they are now, like our own battleship, so that they can be dodged.
+        # extrapolation stops after half a second without updates
+        newest_snapshot = snapshots[-1]
+        elapsed_ticks = (current_time - self.get_snapshot_time(newest_snapshot)) * self.server_tick_rate
+        elapsed_ticks = min(max(elapsed_ticks, 0.0), self.server_tick_rate * 0.5)
+        bullets = [[x + velocity_x * elapsed_ticks, y + velocity_y * elapsed_ticks]
+                   for x, y, velocity_x, velocity_y in newest_snapshot.bullets.values()]
+        return opponents, bullets
+
+
+class PlayerPredictor:
+    # the server owns the battleship. inputs are applied locally as soon as they are made (prediction)
+    # and replayed on top of every authoritative state the server sends back (reconciliation)
+    def __init__(self, server_tick_rate=30, correction_distance=4.0, max_replay_seconds=2.0):
+        self.server_tick_rate = server_tick_rate
+        # smaller differences from the server are left alone, so clock jitter does not shake the battleship.
+        # binary updates round angles to 1/ANGLE_SCALE degrees, so angles that close count as the same
+        self.correction_distance = correction_distance
+        self.angle_tolerance = 1 / ANGLE_SCALE
+        self.max_replay_seconds = max_replay_seconds
+
+        self.input_sequence = 0
+        # inputs not yet confirmed by the server, oldest first
+        self.pending_inputs: collections.deque[dict] = collections.deque()
+
+    def predict_input(self, battleship_o: WorldBattleship, thrust, rotate, shoot, issued_at):
+        self.input_sequence += 1
+        player_input = {"sequence": self.input_sequence, "thrust": thrust, "rotate": rotate, "shoot": shoot}
+        self.pending_inputs.append({**player_input, "issued_at": issued_at})
+        battleship_o.apply_input(thrust, rotate, shoot)
+        return player_input
+
+    def reconcile(self, battleship_o: WorldBattleship, your_data, state_time, current_time):
+        # your_data is the state of our battleship at state_time (local clock)
+        while self.pending_inputs and self.pending_inputs[0]["sequence"] <= your_data["last_processed_input"]:
+            self.pending_inputs.popleft()
+
+        predicted_position = battleship_o.position
+        predicted_angle, predicted_velocity = battleship_o.get_angle(), battleship_o.get_velocity()
+
+        # rewind to the server state then run our unconfirmed inputs forward again, tick by tick.
+        # shots are not replayed, the bullet count below already accounts for them
+        battleship_o.position = list(your_data["battleship_position"])
+        battleship_o.angle = your_data["battleship_angle"]
+        battleship_o.set_velocity(your_data["battleship_velocity_magnitude"])
+
+        max_replay_ticks = round(self.max_replay_seconds * self.server_tick_rate)
+        replayed_ticks = 0
+        for player_input in self.pending_inputs:
+            input_tick = min(max(round((player_input["issued_at"] - state_time) * self.server_tick_rate), 0),
+                             max_replay_ticks)
+            for _ in range(input_tick - replayed_ticks):
+                battleship_o.move()
+            replayed_ticks = max(replayed_ticks, input_tick)
+            battleship_o.apply_input(player_input["thrust"], player_input["rotate"], False)
+        current_tick = min(max(round((current_time - state_time) * self.server_tick_rate), 0), max_replay_ticks)
+        for _ in range(current_tick - replayed_ticks):
+            battleship_o.move()
+
+        (predicted_x, predicted_y), (x, y) = predicted_position, battleship_o.position
+        position_error_squared = (x - predicted_x) ** 2 + (y - predicted_y) ** 2
+        angle_error = (battleship_o.get_angle() - predicted_angle + 180) % 360 - 180
+        if (position_error_squared <= self.correction_distance * self.correction_distance
+                and abs(angle_error) <= self.angle_tolerance):
+            battleship_o.position = predicted_position
+            battleship_o.angle = predicted_angle
+            battleship_o.set_velocity(predicted_velocity)
+
+        # drop the bullets the server says are spent, beyond the shots it has not seen yet
+        pending_shots = sum(1 for player_input in self.pending_inputs if player_input["shoot"])
+        battleship_o.bullets_left = min(battleship_o.bullets_left, max(your_data["bullets_left"] - pending_shots, 0))
+
+
+class RenderCache:
+    # draws into the screen and remembers where. the next frame only erases those areas and hands them,
+    # with the newly drawn ones, to pygame.display.update, instead of clearing and flipping the whole screen.
+    # text and other surfaces that rarely change are rendered once and reused
+    def __init__(self, screen, background="black", max_cached_surfaces=512):
+        self.screen = screen
+        self.background = background
+        self.max_cached_surfaces = max_cached_surfaces
+        self.cached_surfaces = {}
+
+        self.drawn_rects = []
+        self.previous_rects = []
+        # the first frame, and any frame after invalidate, clears and updates the whole screen
+        self.full_redraw = True
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def get_surface(self, key, build_surface):
+        surface = self.cached_surfaces.get(key)
+        if surface is None:
+            # players come and go. start over rather than keep the labels of everyone ever seen
+            if len(self.cached_surfaces) >= self.max_cached_surfaces:
+                self.cached_surfaces.clear()
+            surface = self.cached_surfaces[key] = build_surface()
+        return surface
+
+    def get_label(self, font, text, color):
+        return self.get_surface(("label", font, text, color), lambda: font.render(text, True, color))
+
+    def begin_frame(self):
+        if self.full_redraw:
+            self.screen.fill(self.background)
+        else:
+            for rect in self.previous_rects:
+                self.screen.fill(self.background, rect)
+
+    def circle(self, color, center, radius, width=0):
+        self.drawn_rects.append(pygame.draw.circle(self.screen, color, center, radius, width))
+
+    def line(self, color, start_position, end_position):
+        self.drawn_rects.append(pygame.draw.line(self.screen, color, start_position, end_position))
+
+    def blit(self, surface, position):
+        self.drawn_rects.append(self.screen.blit(surface, position))
+
+    def end_frame(self):
+        if self.full_redraw:
+            pygame.display.flip()
+            self.full_redraw = False
+        else:
+            pygame.display.update(self.previous_rects + self.drawn_rects)
+        self.previous_rects, self.drawn_rects = self.drawn_rects, []
+
+
 class Client2ServerInterface:
-    def __init__(self):
-        self.server_url = "http://127.0.0.1:8000/"
+    # all http traffic goes through one pooled keep-alive session. failed connects are retried with backoff.
+    # requests that already reached the server are not retried, so shots are never sent twice
+    def __init__(self, server_url="http://127.0.0.1:8000/", timeout=(1.0, 2.0), max_retries=3, backoff_factor=0.1,
+                 wire_format="binary"):
+        self.server_url = server_url
+        self.timeout = timeout
+
+        # world data comes either as json or in the compact binary format of protocol.py
+        self.wire_format = wire_format
+
+        retry_policy = Retry(total=max_retries, connect=max_retries, read=0, status=0,
+                             backoff_factor=backoff_factor)
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry_policy))
 
     def get_request(self, path_p):
         server_url = self.server_url
         try:
-            response = requests.get(server_url + path_p)
+            response = self.session.get(server_url + path_p, timeout=self.timeout)
             return response
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             print("Cannot connect to server. Server may be down.")
             return 0
 
     def post_request(self, path_p, json_data):
         server_url = self.server_url
         try:
-            response = requests.post(server_url + path_p, json=json_data)
+            response = self.session.post(server_url + path_p, json=json_data, timeout=self.timeout)
             return response
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            print("Cannot connect to server. Server may be down.")
+            return 0
+
+    def decode_world_update(self, payload):
+        if self.wire_format == "binary":
+            return decode_world_update(payload)
+        return json.loads(payload)
+
+    # game messages. the game loop uses these, so the transport underneath can be swapped
+    def open_session(self, player_name, data_cache: DataCache):
+        pass
+
+    def close_session(self):
+        pass
+
+    def send_player_data(self, player_name, player_data):
+        path_val = f"send_data?player_name={player_name}"
+        return self.post_request(path_val, player_data)
+
+    def shoot_bullet(self, player_name):
+        path_val = f"shoot_bullet?player_name={player_name}"
+        return self.post_request(path_val, {})
+
+    def refresh_world_data(self, player_name, data_cache: DataCache):
+        # request server for the world changes since the last update we received
+        path_val = (f"get_world_data?player_name={player_name}&last_tick={data_cache.last_tick}"
+                    f"&wire_format={self.wire_format}")
+        response = self.get_request(path_val)
+        if not response:
+            return 0
+        data_cache.apply_world_update(self.decode_world_update(response.content))
+        return 1
+
+    def sync_with_server(self, player_name, player_data, shots, data_cache: DataCache, player_inputs=()):
+        # inputs, shots, player data and the world refresh in one round trip
+        path_val = (f"sync?player_name={player_name}&last_tick={data_cache.last_tick}"
+                    f"&wire_format={self.wire_format}")
+        response = self.post_request(path_val, {"player_data": player_data, "shots": shots,
+                                                "inputs": list(player_inputs)})
+        if not response:
+            return 0
+        data_cache.apply_world_update(self.decode_world_update(response.content))
+        return 1
+
+
+class StreamingClient2ServerInterface(Client2ServerInterface):
+    # keeps a single websocket open for the game run. the server pushes world updates into the data cache
+    # from a background thread, so refresh_world_data has nothing left to do
+    def __init__(self, server_url="http://127.0.0.1:8000/", wire_format="binary"):
+        super().__init__(server_url=server_url, wire_format=wire_format)
+        # the stream is served next to the http endpoints. http becomes ws and https wss
+        scheme, separator, address = server_url.partition("://")
+        self.stream_url = {"http": "ws", "https": "wss"}.get(scheme, scheme) + separator + address.rstrip("/") + "/stream"
+        self.websocket = None
+        self.receiver_thread = None
+
+    def open_session(self, player_name, data_cache: DataCache):
+        from websockets.sync.client import connect
+
+        self.websocket = connect(f"{self.stream_url}?player_name={player_name}&wire_format={self.wire_format}")
+        self.receiver_thread = threading.Thread(target=self.receive_world_updates, args=(data_cache,), daemon=True)
+        self.receiver_thread.start()
+
+    def receive_world_updates(self, data_cache: DataCache):
+        from websockets.exceptions import ConnectionClosed
+
+        try:
+            for message in self.websocket:
+                # one bad update is skipped, the stream goes on
+                try:
+                    data_cache.apply_world_update(self.decode_world_update(message))
+                except (ValueError, KeyError, struct.error) as error:
+                    data_cache.record_network_error(error)
+        except ConnectionClosed:
+            print("Stream to server closed.")
+
+    def close_session(self):
+        if self.websocket is not None:
+            self.websocket.close()
+            self.websocket = None
+
+    def send_message(self, message):
+        from websockets.exceptions import ConnectionClosed
+
+        try:
+            self.websocket.send(json.dumps(message))
+            return 1
+        except ConnectionClosed:
             print("Cannot connect to server. Server may be down.")
             return 0
 
+    def send_player_data(self, player_name, player_data):
+        return self.send_message({"type": "send_data", "data": player_data})
+
+    def shoot_bullet(self, player_name):
+        return self.send_message({"type": "shoot_bullet"})
+
+    def refresh_world_data(self, player_name, data_cache: DataCache):
+        return 1
+
+    def send_player_inputs(self, player_name, player_inputs):
+        return self.send_message({"type": "inputs", "inputs": list(player_inputs)})
+
+    def sync_with_server(self, player_name, player_data, shots, data_cache: DataCache, player_inputs=()):
+        if player_inputs:
+            self.send_player_inputs(player_name, player_inputs)
+        for _ in range(shots):
+            self.shoot_bullet(player_name)
+        if player_data is not None:
+            self.send_player_data(player_name, player_data)
+        return 1
+
+
+class NetworkWorker:
+    # does all the talking to the server on a background thread, so the render loop never waits on the network.
+    # the game loop queues messages and reads the results from the data cache.
+    # player data and world refreshes only matter in their latest form, so a backlog of them is collapsed to one.
+    # inputs and shots are always sent, in order
+    def __init__(self, client_2_server_interface, player_name, data_cache: DataCache):
+        self.client_2_server_interface = client_2_server_interface
+        self.player_name = player_name
+        self.data_cache = data_cache
+
+        self.outbound_messages = queue.Queue()
+        self.worker_thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.worker_thread.start()
+
+    def stop(self):
+        self.outbound_messages.put(("stop", None))
+        self.worker_thread.join()
+
+    def send_player_data(self, player_data):
+        self.outbound_messages.put(("send_player_data", player_data))
+
+    def shoot_bullet(self):
+        self.outbound_messages.put(("shoot_bullet", None))
+
+    def send_player_inputs(self, player_inputs):
+        self.outbound_messages.put(("send_player_inputs", player_inputs))
+
+    def refresh_world_data(self):
+        self.outbound_messages.put(("refresh_world_data", None))
+
+    def take_pending_messages(self):
+        # block for the next message then drain whatever else is queued
+        pending_messages = [self.outbound_messages.get()]
+        while True:
+            try:
+                pending_messages.append(self.outbound_messages.get_nowait())
+            except queue.Empty:
+                return pending_messages
+
+    def run(self):
+        client_2_server_interface = self.client_2_server_interface
+        while True:
+            pending_messages = self.take_pending_messages()
+
+            latest_player_data, refresh_requested, shots_requested, stop_requested = None, False, 0, False
+            player_inputs = []
+            for message_type, message_data in pending_messages:
+                if message_type == "send_player_data":
+                    latest_player_data = message_data
+                elif message_type == "send_player_inputs":
+                    player_inputs.extend(message_data)
+                elif message_type == "refresh_world_data":
+                    refresh_requested = True
+                elif message_type == "shoot_bullet":
+                    shots_requested += 1
+                elif message_type == "stop":
+                    stop_requested = True
+
+            # everything pending goes to the server in one round trip. a failed round trip is recorded
+            # and the worker goes on, so the game keeps running and stop still gets through
+            if shots_requested or latest_player_data is not None or refresh_requested or player_inputs:
+                try:
+                    client_2_server_interface.sync_with_server(self.player_name, latest_player_data,
+                                                               shots_requested, self.data_cache, player_inputs)
+                except Exception as error:
+                    self.data_cache.record_network_error(error)
+
+            if stop_requested:
+                return
+
+
+def build_local_player(player_state):
+    # the client simulates its own player in a private world
+    world_to_objects_interface = WorldToObjectsInterface()
+    world_to_players_interface = WorldToPlayersInterface(world_to_objects_interface)
+    player_o = Player(player_state["name"], world_to_objects_interface, world_to_players_interface)
+    player_o.color = player_state["color"]
+
+    battleship_o = player_o.world_battleship
+    battleship_o.position = player_state["battleship_position"]
+    battleship_o.angle = player_state["battleship_angle"]
+    battleship_o.set_velocity(player_state["battleship_velocity_magnitude"])
+
+    # the server says how many bullets are left
+    battleship_o.bullets_left = player_state["bullets_left"]
+    return player_o
+
+
+def run_headless_game(player_as_object, network_worker: NetworkWorker, client_data_cache: DataCache,
+                      bot_pilot: BotPilot, duration=60.0, input_interval=0.1, contact_server_interval=0.2):
+    # the game loop without a display. the bot pilot makes an input every input_interval and our battleship
+    # is predicted and reconciled as in the game window. returns when killed or after duration seconds
+    battleship_o = player_as_object.world_battleship
+    player_predictor = PlayerPredictor(client_data_cache.server_tick_rate)
+    last_reconciled_tick = None
+
+    tick_interval = 1 / client_data_cache.server_tick_rate
+    next_tick_time = next_input_time = next_contact_time = start_time = time.time()
+    while time.time() - start_time < duration:
+        current_time = time.time()
+
+        world_data = client_data_cache.world_data
+        if world_data is not None and world_data["tick"] != last_reconciled_tick:
+            last_reconciled_tick = world_data["tick"]
+            my_data = world_data["your_data"]
+            if my_data["killed"]:
+                print("You have been killed!")
+                return
+            if "last_processed_input" in my_data:
+                player_predictor.reconcile(battleship_o, my_data, client_data_cache.get_tick_time(world_data["tick"]),
+                                           current_time)
+
+        if current_time >= next_input_time:
+            next_input_time += input_interval
+            thrust, rotate, shoot = bot_pilot.next_input()
+            if thrust or rotate or shoot:
+                player_input = player_predictor.predict_input(battleship_o, thrust, rotate, shoot, current_time)
+                network_worker.send_player_inputs([player_input])
+
+        if current_time >= next_contact_time:
+            next_contact_time += contact_server_interval
+            network_worker.refresh_world_data()
+
+        # one step of our battleship per server tick
+        battleship_o.update()
+        next_tick_time += tick_interval
+        time.sleep(max(next_tick_time - time.time(), 0))
+
 
 def run_game_client(client_config_data, client_2_server_interface: Client2ServerInterface,
                     client_data_cache: DataCache):
 
     # load client config details
     client_name, player_color = client_config_data["client_name"], client_config_data["player_color"]
+    frame_rate = client_config_data.get("frame_rate", 30)
     print(f"Kicking off client script. Welcome {client_name}!")
 
 
     # 1. request server to enter the game
     # server creates a new player with given name
-    path_v = f"enter?player_name={client_name}"
+    path_v = f"enter?player_name={client_name}&player_color={player_color}"
     response_v = client_2_server_interface.get_request(path_v)
     if not response_v:
         raise requests.exceptions.ConnectionError('Cannot connect to server. Server may be down.')
+    enter_reply = response_v.json()
+    if not enter_reply.get("joined"):
+        # arenas full or name taken. the server says which
+        print(f"Could not enter the game: {enter_reply.get('player_data')}")
+        return
     print("You have entered the game.")
 
 
-    # 2. get newly created player object from the server
+    # 2. get newly created player state from the server and rebuild the player locally
     path_v = f"get_my_data?player_name={client_name}"
-    player_as_bytes = client_2_server_interface.get_request(path_v).content
-    player_as_object = pickle.loads(player_as_bytes)
+    response_v = client_2_server_interface.get_request(path_v)
+    if not response_v or response_v.headers.get("content-type") != BINARY_MEDIA_TYPE:
+        print("Could not fetch the player data from the server.")
+        return
+    player_as_object = build_local_player(decode_player_state(response_v.content))
     print("Player data has been fetched from the server.")
 
 
-    # 3. now with the data pulled from server, load it into the game engine
+    # 3. open the game session. streaming interfaces start receiving world updates from here on
+    # all game time talking to the server goes through the network worker
+    client_2_server_interface.open_session(client_name, client_data_cache)
+    network_worker = NetworkWorker(client_2_server_interface, client_name, client_data_cache)
+    network_worker.start()
+
+
+    # 4. now with the data pulled from server, load it into the game engine
     # then run the game, periodically communicating with the server for updates
     def run_game():
         # create time handler
@@ -83,35 +597,34 @@ def run_game_client(client_config_data, client_2_server_interface: Client2Server
                     return True
                 return False
 
-        # use this to make the world_battleship respond to user events
+        # use this to make the world_battleship respond to user events.
+        # key presses become inputs, which are applied locally straight away (prediction) and sent to the server
         def world_battleship_event_handler(world_battleship: WorldBattleship, key_pressed_dict_p,
                                            time_handle: TimeHandler):
 
-            velocity_change = 0.3
-            angle_increment = 8
-
+            thrust, rotate, shoot = 0, 0, False
             if key_pressed_dict_p[pygame.K_UP]:
                 if time_handle.check_for_time_constraint("battleship_velocity_change_interval"):
-                    current_velocity = world_battleship.get_velocity()
-                    world_battleship.set_velocity(current_velocity + velocity_change)
+                    thrust = 1
             elif key_pressed_dict_p[pygame.K_DOWN]:
                 if time_handle.check_for_time_constraint("battleship_velocity_change_interval"):
-                    current_velocity = world_battleship.get_velocity()
-                    world_battleship.set_velocity(current_velocity - velocity_change)
+                    thrust = -1
 
             elif key_pressed_dict_p[pygame.K_RIGHT]:
                 if time_handle.check_for_time_constraint("battleship_rotate_interval"):
-                    world_battleship.rotate_yourself(angle_increment)
+                    rotate = 1
             elif key_pressed_dict_p[pygame.K_LEFT]:
                 if time_handle.check_for_time_constraint("battleship_rotate_interval"):
-                    world_battleship.rotate_yourself(-angle_increment)
+                    rotate = -1
 
             # battleship shoots bullet if space is pressed
             if key_pressed_dict_p[pygame.K_SPACE]:
                 if time_handle.check_for_time_constraint("battleship_shoot_bullet"):
-                    world_battleship.shoot_bullet()
-                    path_val = f"shoot_bullet?player_name={client_name}"
-                    client_2_server_interface.post_request(path_val, {})
+                    shoot = True
+
+            if thrust or rotate or shoot:
+                player_input = player_predictor.predict_input(world_battleship, thrust, rotate, shoot, time.time())
+                network_worker.send_player_inputs([player_input])
 
         pygame.init()
 
@@ -130,6 +643,10 @@ def run_game_client(client_config_data, client_2_server_interface: Client2Server
         # create a time_handler
         time_handler = TimeHandler()
 
+        # predicts our battleship ahead of the server and corrects it when the server state comes in
+        player_predictor = PlayerPredictor(client_data_cache.server_tick_rate)
+        last_reconciled_tick = None
+
         # create a help screen
         def create_help_screen_surface():
             help_screen_surface = pygame.surface.Surface((SCREEN_WIDTH * 0.6, SCREEN_HEIGHT * 0.6))
@@ -153,6 +670,21 @@ def run_game_client(client_config_data, client_2_server_interface: Client2Server
             return help_screen_surface
         help_screen = create_help_screen_surface()
 
+        # the bullet count display, one surface per count
+        def create_bullet_count_surface(count_of_bullets):
+            bullet_count_surface = pygame.surface.Surface((20, max(20 * count_of_bullets - 10, 1)))
+            bullet_count_surface.fill("black")
+            for bullet_index in range(count_of_bullets):
+                pygame.draw.rect(bullet_count_surface, "orange", [0, 20 * bullet_index, 20, 10])
+            return bullet_count_surface
+
+        # only the parts of the screen drawn in this frame or the last one are cleared and updated
+        render_cache = RenderCache(screen)
+
+        # our battleship moves once per server tick, like on the server, whatever the frame rate
+        local_tick_interval = 1 / client_data_cache.server_tick_rate
+        next_local_tick_time = time.time()
+
         clock = pygame.time.Clock()
         game_over = False
         while not game_over:
@@ -160,6 +692,9 @@ def run_game_client(client_config_data, client_2_server_interface: Client2Server
                 if event.type == pygame.QUIT:
                     game_over = True
                     break
+                # the window was uncovered or resized, the areas we did not touch are stale
+                if event.type in (pygame.VIDEOEXPOSE, pygame.VIDEORESIZE):
+                    render_cache.invalidate()
             if game_over:
                 break
 
@@ -175,36 +710,36 @@ def run_game_client(client_config_data, client_2_server_interface: Client2Server
                 if time_handler.check_for_time_constraint("help_screen_display_interval"):
                     display_help_screen = not display_help_screen
 
-            # update the battleship state
-            battleship_o.update()
+            # the network worker may swap in new world data at any time. use one version for the whole frame
+            world_data = client_data_cache.world_data
+
+            # correct our prediction once for every new server state of our battleship
+            if world_data is not None and world_data["tick"] != last_reconciled_tick:
+                last_reconciled_tick = world_data["tick"]
+                my_data = world_data["your_data"]
+                if "last_processed_input" in my_data:
+                    player_predictor.reconcile(battleship_o, my_data, client_data_cache.get_tick_time(world_data["tick"]),
+                                               time.time())
+
+            # update the battleship state. after a long stall, catch up with the current time instead
+            current_time = time.time()
+            if current_time - next_local_tick_time > 0.5:
+                next_local_tick_time = current_time
+            while next_local_tick_time <= current_time:
+                battleship_o.update()
+                next_local_tick_time += local_tick_interval
 
             # <-------- this starts the data communication with server for updates section-------->
 
-            # logic to update data cache and periodically send updated player data to server (ever 2 second)
-            # also receive other player (opponents) and world data
-            # todo: limit the rate of this time check. it runs at 30 fps and is a waste
+            # inputs go to the server as they are made. periodically request server for updated world data
+            # todo: limit the rate of this time check. it runs once per frame and is a waste
             if time_handler.check_for_time_constraint("contact_server_interval"):
-                # periodically send updated player data to the server
-                updated_player_data_to_sent = {
-                    "client_name": client_name,
-                    "battleship_position": battleship_o.position,
-                    "player_color": player_color,
-                    "battleship_angle": battleship_o.angle,
-                    "battleship_velocity_magnitude": battleship_o.get_velocity()
-                }
-                path_val = f"send_data?player_name={client_name}"
-                client_2_server_interface.post_request(path_val, updated_player_data_to_sent)
-
-                # periodically request server for updated world data
-                path_val = f"get_world_data?player_name={client_name}"
-                world_data = client_2_server_interface.get_request(path_val).json()
-                client_data_cache.world_data = world_data
-
+                network_worker.refresh_world_data()
 
             # from the data received by server check if I have been killed (possible collision)
-            if client_data_cache.world_data is not None:
+            if world_data is not None:
                 if not check_if_i_am_killed:
-                    my_data = client_data_cache.world_data["your_data"]
+                    my_data = world_data["your_data"]
                     check_if_i_am_killed = my_data["killed"]
                     if check_if_i_am_killed:
                         i_have_been_killed_at_time = time.time()
@@ -212,44 +747,52 @@ def run_game_client(client_config_data, client_2_server_interface: Client2Server
 
 
             # <-------- this starts the display section v-------->
+            render_cache.begin_frame()
+
             # display this when the player is alive
             if not check_if_i_am_killed:
 
 
                 # display opponents in the world
-                if client_data_cache.world_data is not None:
-                    opponents_data = client_data_cache.world_data["opponent_player_data"]
-                    world_objects_data = client_data_cache.world_data["world_objects_data"]
-                    all_bullets = world_objects_data["bullets"]
+                if world_data is not None:
+                    # smoothed positions between the server updates
+                    opponents_data, all_bullets = client_data_cache.get_render_state(time.time())
 
                     # display the opponent players and their relevant details
                     for opponent_name, data_v in opponents_data.items():
                         opp_player_name, opp_player_position, opp_player_color = (data_v["name"], data_v["battleship_position"],
                                                                                   data_v["color"])
-                        pygame.draw.circle(screen, opp_player_color, opp_player_position, 5)
+                        render_cache.circle(opp_player_color, opp_player_position, 5)
 
 
                         # display opponent player name next to their battleship
-                        my_name = font_10.render(opp_player_name, True, "red")
+                        my_name = render_cache.get_label(font_10, opp_player_name, "red")
                         text_position = [opp_player_position[0] + 10, opp_player_position[1] - 20]
-                        screen.blit(my_name, text_position)
+                        render_cache.blit(my_name, text_position)
 
                     # display the bullets
                     for bullet_data in all_bullets:
-                        pygame.draw.circle(screen, "orange", bullet_data, 3)
+                        render_cache.circle("orange", bullet_data, 3)
+
+                    # the server only sends what is near us. further away there is a count per area
+                    for center_x, center_y, player_count, bullet_count in world_data.get("distant_summary", ()):
+                        if player_count:
+                            render_cache.circle("gray30", [center_x, center_y], 4 + min(player_count, 8), 1)
+                        if bullet_count:
+                            render_cache.circle("gray20", [center_x, center_y], 2)
 
 
 
                 # display the player in the world
                 my_battleship_position = battleship_o.position
-                pygame.draw.circle(screen, player_color, my_battleship_position, 5)
+                render_cache.circle(player_color, my_battleship_position, 5)
 
                 # draw the collision radius
-                pygame.draw.circle(screen, "red", my_battleship_position, 10, 1)
+                render_cache.circle("red", my_battleship_position, 10, 1)
 
-                my_name = font_10.render(client_name, True, "white")
+                my_name = render_cache.get_label(font_10, client_name, "white")
                 text_position = [my_battleship_position[0] + 10, my_battleship_position[1] - 20]
-                screen.blit(my_name, text_position)
+                render_cache.blit(my_name, text_position)
 
                 # display player velocity indicator
                 starting_node = my_battleship_position
@@ -257,41 +800,55 @@ def run_game_client(client_config_data, client_2_server_interface: Client2Server
                 velocity_vector = battleship_o.get_velocity_components()
                 velocity_vector_scaled = [i * scaling_factor for i in velocity_vector]
                 ending_node = [starting_node[0] + velocity_vector_scaled[0], starting_node[1] + velocity_vector_scaled[1]]
-                pygame.draw.line(screen, "white", starting_node, ending_node)
+                render_cache.line("white", starting_node, ending_node)
 
                 # display bullet count
-                count_of_bullets_left = len(battleship_o.bullets)
-                start_position = [SCREEN_WIDTH * 0.9, SCREEN_HEIGHT * 0.08]
-                for bullet_index in range(count_of_bullets_left):
-                    new_position = [start_position[0], start_position[1] + (20 * bullet_index)]
-                    pygame.draw.rect(screen, "orange", [new_position[0], new_position[1], 20, 10])
+                count_of_bullets_left = battleship_o.bullets_left
+                if count_of_bullets_left:
+                    bullet_count_surface = render_cache.get_surface(
+                        ("bullet_count", count_of_bullets_left),
+                        lambda: create_bullet_count_surface(count_of_bullets_left))
+                    render_cache.blit(bullet_count_surface, [SCREEN_WIDTH * 0.9, SCREEN_HEIGHT * 0.08])
 
 
                 # display help screen is enabled
                 if display_help_screen:
-                    screen.blit(help_screen, [20, 20])
+                    render_cache.blit(help_screen, [20, 20])
 
             # display this after player is killed
             else:
-                my_name = font_15.render("you have been killed!".upper(), True, "red")
+                my_name = render_cache.get_label(font_15, "you have been killed!".upper(), "red")
                 text_position = [SCREEN_WIDTH / 2 - 80, SCREEN_HEIGHT / 2 - 20]
-                screen.blit(my_name, text_position)
+                render_cache.blit(my_name, text_position)
 
                 # if 10 seconds have elapsed exit the game
                 if time.time() - i_have_been_killed_at_time >= 8:
                     break
 
-            pygame.display.flip()
-            screen.fill("black")
-            clock.tick(30)
+            render_cache.end_frame()
+            clock.tick(frame_rate)
 
         # request server to exit the game
+        network_worker.stop()
+        client_2_server_interface.close_session()
         path_val = f"exit?player_name={client_name}"
         client_2_server_interface.get_request(path_val)
         print("Leaving the game run.")
 
         pygame.quit()
 
+    # 5. headless players are driven by a bot pilot instead of the keyboard, and draw nothing
+    if client_config_data.get("headless"):
+        print("Starting the headless game run.")
+        run_headless_game(player_as_object, network_worker, client_data_cache,
+                          BotPilot(client_config_data.get("bot_script"), client_config_data.get("bot_seed")),
+                          client_config_data.get("duration", 60.0))
+        network_worker.stop()
+        client_2_server_interface.close_session()
+        client_2_server_interface.get_request(f"exit?player_name={client_name}")
+        print("Leaving the game run.")
+        return
+
     print("Starting the game run.")
     run_game()
 
@@ -304,17 +861,34 @@ if __name__ == "__main__":
     # parser.add_argument("-n", "--name", help="Player Name")
     parser.add_argument("player_name")
     parser.add_argument("player_color")
+    parser.add_argument("--server-url", default="http://127.0.0.1:8000/")
+    parser.add_argument("--stream", action="store_true", help="talk to the server over a websocket")
+    parser.add_argument("--fps", type=int, default=30, help="frame rate cap")
+    parser.add_argument("--headless", action="store_true", help="play without a window, driven by a bot")
+    parser.add_argument("--script", default=None,
+                        help=f"comma separated bot inputs out of {', '.join(BOT_SCRIPT_INPUTS)}. random if not given")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random bot inputs")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds a headless player stays in the game")
 
     args = parser.parse_args()
+    try:
+        bot_script_v = parse_bot_script(args.script) if args.script else None
+    except ValueError as error:
+        parser.error(str(error))
 
     # create an internal config for client settings
-    client_config_data_v = {"client_name": args.player_name, "player_color": args.player_color}
+    client_config_data_v = {"client_name": args.player_name, "player_color": args.player_color,
+                            "frame_rate": args.fps, "headless": args.headless, "bot_script": bot_script_v,
+                            "bot_seed": args.seed, "duration": args.duration}
 
     # create client to server interface
-    client_2_server_interface_v = Client2ServerInterface()
+    if args.stream:
+        client_2_server_interface_v = StreamingClient2ServerInterface(server_url=args.server_url)
+    else:
+        client_2_server_interface_v = Client2ServerInterface(server_url=args.server_url)
 
     # create client data cache
-    client_data_cache_v = DataCache()
+    client_data_cache_v = DataCache(args.player_name)
 
     # run game with player object
     run_game_client(client_config_data_v, client_2_server_interface_v, client_data_cache_v)
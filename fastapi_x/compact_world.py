@@ -0,0 +1,79 @@
+from game import WorldToObjectsInterface, WorldBullet, WorldBattleship, get_unit_vector
+
+
+#############################################################################
+
+# this starts the compact world objects that update in place
+
+#############################################################################
+
+class CompactWorldBullet(WorldBullet):
+    # owns its position and velocity lists for its whole life, pool reuse included.
+    # moving and shooting write into them, so a tick allocates nothing
+    __slots__ = ()
+
+    def __init__(self, world_interface: WorldToObjectsInterface, velocity=None, name_extended=""):
+        super().__init__(world_interface, velocity=velocity, name_extended=name_extended)
+        self.position = [0.0, 0.0]
+
+    def set_position(self, position):
+        # copies, the given position usually belongs to the battleship shooting the bullet
+        own_position = self.position
+        own_position[0], own_position[1] = position
+
+    def set_velocity(self, velocity):
+        own_velocity = self.velocity
+        own_velocity[0], own_velocity[1] = velocity
+
+    def move(self):
+        position, velocity = self.position, self.velocity
+        position[0] += velocity[0]
+        position[1] += velocity[1]
+
+    def reset_bullet(self):
+        position, velocity = self.position, self.velocity
+        super().reset_bullet()
+        position[0] = position[1] = 0.0
+        velocity[0] = velocity[1] = 0.5
+        self.position, self.velocity = position, velocity
+
+
+class CompactWorldBattleship(WorldBattleship):
+    # same behaviour as WorldBattleship, with position and velocity components updated in place
+    __slots__ = ()
+
+    def update_velocity_components(self, velocity_magnitude):
+        cos_angle, sin_angle = get_unit_vector(self.angle)
+        velocity_components = self._velocity_components
+        velocity_components[0] = round(velocity_magnitude * cos_angle, 2)
+        velocity_components[1] = round(velocity_magnitude * sin_angle, 2)
+        self._velocity_components_angle = self.angle
+
+    def set_velocity(self, new_velocity):
+        if abs(new_velocity) <= self._max_velocity_magnitude:
+            self._velocity_magnitude = round(new_velocity, 2)
+            self.update_velocity_components(new_velocity)
+
+    def rotate_yourself(self, angle_to_rotate_by):
+        self.angle = self.angle + angle_to_rotate_by
+        self.update_velocity_components(self._velocity_magnitude)
+
+    def move(self):
+        # slow down the player naturally. the velocity components are only recomputed if they are out of date
+        new_velocity = abs(self._velocity_magnitude) - self._natural_deceleration
+        if new_velocity != self._velocity_magnitude or self.angle != self._velocity_components_angle:
+            self.set_velocity(new_velocity)
+
+        position, velocity_components = self.position, self._velocity_components
+        position[0] += velocity_components[0]
+        position[1] += velocity_components[1]
+
+
+class CompactWorldToObjectsInterface(WorldToObjectsInterface):
+    # use it in place of WorldToObjectsInterface. world objects keep their lists,
+    # so anyone holding on to a position has to copy it
+    def make_bullet(self, name_extended=""):
+        return CompactWorldBullet(world_interface=self, name_extended=name_extended)
+
+    def make_battleship(self, name_extended=""):
+        return CompactWorldBattleship(self, name_extended)
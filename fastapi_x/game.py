@@ -1,5 +1,6 @@
 import math
 import time
+import itertools
 
 #############################################################################
 
@@ -7,11 +8,29 @@ import time
 
 #############################################################################
 
+# battleships turn in steps of this many degrees. the unit vectors of those angles are computed once
+ANGLE_STEP = 8
+UNIT_VECTORS_BY_ANGLE = {angle: (math.cos(math.radians(angle)), math.sin(math.radians(angle)))
+                         for angle in range(0, 360, ANGLE_STEP)}
+
+
+def get_unit_vector(angle):
+    # (cos, sin) of an angle in degrees. angles off the rotation steps are computed
+    unit_vector = UNIT_VECTORS_BY_ANGLE.get(angle % 360)
+    if unit_vector is None:
+        radians = math.radians(angle)
+        unit_vector = (math.cos(radians), math.sin(radians))
+    return unit_vector
+
+
 class ObjectBase:
     pass
 
 
 class Bullet:
+    # slots keep game objects small. there are many bullets per player
+    __slots__ = ("activated", "activation_time", "position", "velocity")
+
     def __init__(self, velocity=None):
         self.activated = False
         self.activation_time = None
@@ -42,23 +61,26 @@ class Bullet:
         return "bullet"
 
 class Battleship:
+    __slots__ = ("position", "bullets_left", "angle", "_natural_deceleration", "_max_velocity_magnitude",
+                 "_velocity_magnitude", "_velocity_components", "_velocity_components_angle")
 
     def __init__(self):
         self.position = [40, 40]
-        self.bullets = []
+        self.bullets_left = 0
 
         self.angle = 0
         self._natural_deceleration = 0.00
         self._max_velocity_magnitude = 3
         self._velocity_magnitude = 0.6
         self._velocity_components = self.compute_velocity_components(self.angle, self._velocity_magnitude)
+        # the angle the velocity components were computed for. the angle can also be set directly
+        self._velocity_components_angle = self.angle
 
 
     @staticmethod
     def compute_velocity_components(angle, velocity_magnitude):
-        x, y = (velocity_magnitude * math.cos(math.radians(angle)),
-                velocity_magnitude * math.sin(math.radians(angle)))
-        x, y = round(x, 2), round(y, 2)
+        cos_angle, sin_angle = get_unit_vector(angle)
+        x, y = round(velocity_magnitude * cos_angle, 2), round(velocity_magnitude * sin_angle, 2)
         return [x, y]
 
 
@@ -69,6 +91,7 @@ class Battleship:
             # when velocity_magnitude is updated, it should automatically update velocity components
             x, y = self.compute_velocity_components(self.angle, new_velocity)
             self._velocity_components = [x, y]
+            self._velocity_components_angle = self.angle
 
     def get_velocity(self):
         return self._velocity_magnitude
@@ -86,11 +109,14 @@ class Battleship:
 
         # update velocity components to face the new angle. velocity magnitude remains the same
         self._velocity_components = self.compute_velocity_components(new_angle, self._velocity_magnitude)
+        self._velocity_components_angle = new_angle
 
 
     def move(self):
-        # slow down the player naturally
-        self.set_velocity(abs(self._velocity_magnitude) - self._natural_deceleration)
+        # slow down the player naturally. the velocity components are only recomputed if they are out of date
+        new_velocity = abs(self._velocity_magnitude) - self._natural_deceleration
+        if new_velocity != self._velocity_magnitude or self.angle != self._velocity_components_angle:
+            self.set_velocity(new_velocity)
 
         x, y = tuple(self.position)
         dx, dy = tuple(self._velocity_components)
@@ -111,73 +137,203 @@ class Battleship:
 
 #############################################################################
 
+class BulletPool:
+    # hands out the bullets of the whole world. released bullets go on a free list and are handed out again,
+    # so once the pool is warm, shooting allocates nothing however fast players join and leave.
+    # at most max_free_bullets are kept around, the rest are left to the garbage collector
+    def __init__(self, make_bullet, max_free_bullets=4096):
+        self.make_bullet = make_bullet
+        self.max_free_bullets = max_free_bullets
+        self.free_bullets: list[WorldBullet] = []
+
+        # occupancy stats
+        self.bullets_in_use = 0
+        self.peak_bullets_in_use = 0
+        self.bullets_created = 0
+        self.bullets_reused = 0
+
+    def acquire(self, name_extended=""):
+        if self.free_bullets:
+            bullet_o = self.free_bullets.pop()
+            bullet_o.name_extended = name_extended
+            self.bullets_reused += 1
+        else:
+            bullet_o = self.make_bullet(name_extended)
+            self.bullets_created += 1
+        self.bullets_in_use += 1
+        self.peak_bullets_in_use = max(self.peak_bullets_in_use, self.bullets_in_use)
+        return bullet_o
+
+    def release(self, bullet_o):
+        bullet_o.reset_bullet()
+        self.bullets_in_use -= 1
+        if len(self.free_bullets) < self.max_free_bullets:
+            self.free_bullets.append(bullet_o)
+
+    def get_stats(self):
+        return {"in_use": self.bullets_in_use,
+                "free": len(self.free_bullets),
+                "peak_in_use": self.peak_bullets_in_use,
+                "created": self.bullets_created,
+                "reused": self.bullets_reused}
+
+
 class WorldToObjectsInterface:
 
     def __init__(self):
-        self.objects_list = []
+        # every object is registered under a world unique id. objects are also bucketed by their type
+        # and activated bullets are tracked on their own, so lookups never scan the whole world
+        self.objects_registry: dict[int, object] = {}
+        self.objects_by_type: dict[type, dict[int, object]] = {}
+        self.activated_bullets: dict[int, WorldBullet] = {}
+        self._object_id_counter = itertools.count(1)
+
+        # bullets only enter the world when they are shot, and go back to the pool when they are spent
+        self.bullet_pool = BulletPool(self.make_bullet)
+
+        # the world clock. counts simulation ticks and is advanced by the server world
+        self.current_tick = 0
 
     def get_objects(self):
-        return self.objects_list
+        return list(self.objects_registry.values())
+
+    def get_object_by_id(self, object_id):
+        return self.objects_registry.get(object_id)
+
+    def get_objects_of_type(self, object_type: type):
+        objects_of_type = []
+        for bucket_type, bucket in self.objects_by_type.items():
+            if issubclass(bucket_type, object_type):
+                objects_of_type.extend(bucket.values())
+        return objects_of_type
+
+    def register_object(self, object_to_add):
+        # returns True if the object was not in the world yet. objects get their id when they enter the world
+        object_id = getattr(object_to_add, "object_id", None)
+        if object_id is None:
+            object_id = next(self._object_id_counter)
+            object_to_add.object_id = object_id
+
+        if object_id in self.objects_registry:
+            return False
+        self.objects_registry[object_id] = object_to_add
+        self.objects_by_type.setdefault(type(object_to_add), {})[object_id] = object_to_add
+        if isinstance(object_to_add, WorldBullet) and object_to_add.activated:
+            self.activated_bullets[object_id] = object_to_add
+        return True
+
+    def unregister_object(self, object_to_remove):
+        # returns True only if this exact object was in the world
+        object_id = getattr(object_to_remove, "object_id", None)
+        if self.objects_registry.get(object_id) is not object_to_remove:
+            return False
+        del self.objects_registry[object_id]
+        del self.objects_by_type[type(object_to_remove)][object_id]
+        self.activated_bullets.pop(object_id, None)
+        return True
 
     def add_game_object(self, object_to_add):
-        if object_to_add not in self.objects_list:
-            self.objects_list.append(object_to_add)
-            print(f"Adding object to world: {object_to_add}.\n\t{self}")
+        # one line per object. printing the whole world here made every join O(n) on the tick thread
+        if self.register_object(object_to_add):
+            print(f"Adding object to world: {object_to_add}.")
 
     def remove_game_object(self, object_to_remove):
-        if object_to_remove in self.objects_list:
-            self.objects_list.remove(object_to_remove)
-            print(f"Removing object from world: {object_to_remove}.\n\t{self}")
+        if self.unregister_object(object_to_remove):
+            print(f"Removing object from world: {object_to_remove}.")
+
+    def acquire_bullet(self, name_extended=""):
+        # an inactive bullet from the pool. it enters the world when it is activated
+        return self.bullet_pool.acquire(name_extended)
+
+    def release_bullet(self, bullet_o):
+        # takes a bullet out of the world and hands it back to the pool. releasing twice does nothing
+        if self.unregister_object(bullet_o):
+            self.bullet_pool.release(bullet_o)
+
+    # factories used by the bullet pool and players to create their world objects.
+    # override these to change how world objects are stored
+    def make_bullet(self, name_extended=""):
+        return WorldBullet(world_interface=self, name_extended=name_extended)
+
+    def make_battleship(self, name_extended=""):
+        return WorldBattleship(self, name_extended)
 
     def get_bullets(self, get_only_activated=False):
-        all_bullets = [object_o for object_o in self.get_objects() if isinstance(object_o, WorldBullet)]
         if get_only_activated:
-            all_bullets = [bullet_o for bullet_o in all_bullets if bullet_o.activated]
-        return all_bullets
+            return list(self.activated_bullets.values())
+        return self.get_objects_of_type(WorldBullet)
 
     def __str__(self):
-        str_v = "[" + ", ".join([str(p) for p in self.objects_list]) + "]"
+        str_v = "[" + ", ".join([str(p) for p in self.objects_registry.values()]) + "]"
         return f"List of objects: {str_v}"
 
 
 class WorldBullet(Bullet):
+    __slots__ = ("object_id", "activation_tick", "name_extended", "world_interface")
+
     def __init__(self, world_interface: WorldToObjectsInterface, velocity=None, name_extended=""):
         super().__init__(velocity=velocity)
+        self.object_id = None
+        self.activation_tick = None
         self.name_extended = name_extended
         self.world_interface = world_interface
-        self.world_interface.add_game_object(self)
+
+    def activate_bullet(self):
+        super().activate_bullet()
+        self.activation_tick = self.world_interface.current_tick
+        self.world_interface.register_object(self)
+
+    def reset_bullet(self):
+        # back to the state of a new bullet, ready to be handed out again. it gets a new id when shot
+        self.activated = False
+        self.activation_time = None
+        self.activation_tick = None
+        self.position = None
+        self.velocity = [0.5, 0.5]
+        self.object_id = None
 
     def __del__(self):
-        self.world_interface.remove_game_object(self)
+        self.world_interface.release_bullet(self)
 
     def __str__(self):
         return "world_" + super().__str__() + "_" +  self.name_extended
 
 
 class WorldBattleship(Battleship):
+    __slots__ = ("object_id", "name_extended", "world_interface")
+
     def __init__(self, world_interface: WorldToObjectsInterface, name_extended=""):
         super().__init__()
+        self.object_id = None
         self.name_extended = name_extended
-        self.bullets = WorldBattleship.initialize(world_interface, name_extended)
+        # give the battleship 10 bullets. they are taken from the world bullet pool when shot
+        self.bullets_left = WorldBattleship.magazine_size
         self.world_interface = world_interface
         self.world_interface.add_game_object(self)
 
-    @staticmethod
-    def initialize(world_interface, name_extended):
-        # give the battleship 10 bullets
-        number_of_bullets = 10
-        bullet_list = [WorldBullet(world_interface=world_interface, name_extended=name_extended)
-                       for _ in range(number_of_bullets)]
-        return bullet_list
+    magazine_size = 10
 
+    # how much one player input changes the battleship. client prediction and server must agree on these
+    velocity_change_per_input = 0.3
+    angle_change_per_input = ANGLE_STEP
+
+    def apply_input(self, thrust, rotate, shoot):
+        # thrust and rotate are -1, 0 or 1. mirrors the key handling of the client
+        if thrust:
+            self.set_velocity(self.get_velocity() + thrust * self.velocity_change_per_input)
+        elif rotate:
+            self.rotate_yourself(rotate * self.angle_change_per_input)
+        if shoot:
+            self.shoot_bullet()
 
     def shoot_bullet(self):
         # when bullet is shot in world, activate it and remove bullet from battleship
 
         # check if any bullets exist
-        if len(self.bullets) > 0:
+        if self.bullets_left > 0:
             # is yes, then take a bullet out
-            bullet_to_shoot = self.bullets.pop()
+            self.bullets_left -= 1
+            bullet_to_shoot = self.world_interface.acquire_bullet(self.name_extended)
 
             # assign it bullet position which is battleship position. activate it
             bullet_to_shoot.set_position(self.position)
@@ -186,10 +342,7 @@ class WorldBattleship(Battleship):
             bullet_to_shoot.activate_bullet()
 
     def __del__(self):
-        # when a battleship is deleted all its child objects (bullets) should be deleted as well
-        for bullet_o in self.bullets:
-            bullet_o.__del__()
-
+        # bullets already shot live on in the world until they are spent
         self.world_interface.remove_game_object(self)
 
     def __str__(self):
@@ -202,6 +355,9 @@ class WorldBattleship(Battleship):
 #############################################################################
 
 class Player:
+    __slots__ = ("world_to_objects_interface", "world_to_players_interface", "name", "world_battleship",
+                 "pending_inputs", "last_queued_input", "last_processed_input", "color")
+
     def __init__(self, name: str,
                  world_to_objects_interface: WorldToObjectsInterface,
                  world_to_players_interface):
@@ -214,6 +370,13 @@ class Player:
         self.name : str = name
         self.world_battleship: WorldBattleship | None = None
 
+        # inputs sent by the client, applied by the server world at the next tick.
+        # the sequence number of the last applied input is sent back so the client can reconcile.
+        # a plain list, a deque costs several hundred bytes per player even when empty
+        self.pending_inputs = []
+        self.last_queued_input = 0
+        self.last_processed_input = 0
+
         # initialize the attributes
         self.initialize()
 
@@ -225,10 +388,10 @@ class Player:
         world_to_players_interface = self.world_to_players_interface
 
         # create a battleship object
-        self.world_battleship = WorldBattleship(world_to_objects_interface, self.name)
+        self.world_battleship = world_to_objects_interface.make_battleship(self.name)
 
-        # add player to players list
-        world_to_players_interface.players_list.append(self)
+        # add player to players index
+        world_to_players_interface.register_player(self)
 
     def get_player_objects(self):
         return [self.world_battleship]
@@ -239,8 +402,7 @@ class Player:
         # remove player object reference
 
         # prevent multiple del calls
-        if self in world_to_players_interface.players_list:
-            world_to_players_interface.players_list.remove(self)
+        if world_to_players_interface.unregister_player(self):
 
             # when a player is deleted all its child objects should be deleted as well
             for player_object_o in self.get_player_objects():
@@ -252,30 +414,44 @@ class Player:
 
 class WorldToPlayersInterface:
     def __init__(self, world_to_objects_interface: WorldToObjectsInterface):
-        self.players_list: list[Player] = []
+        # players are indexed by name. names are unique within the world
+        self.players_by_name: dict[str, Player] = {}
         self.world_to_objects_interface = world_to_objects_interface
 
     def get_all_players(self) -> list[Player]:
-        return self.players_list
+        return list(self.players_by_name.values())
 
     def get_player_by_name(self, player_name) -> Player | None:
-        for player_o in self.players_list:
-            if player_o.name == player_name:
-                return player_o
+        return self.players_by_name.get(player_name)
+
+    def get_players_by_names(self, player_names) -> dict[str, Player | None]:
+        players_by_name = self.players_by_name
+        return {player_name: players_by_name.get(player_name) for player_name in player_names}
 
-    def create_player(self,  player_name: str):
+    def register_player(self, player_o: Player):
+        self.players_by_name[player_o.name] = player_o
+
+    def unregister_player(self, player_o: Player):
+        # returns True only if this exact player was registered
+        if self.players_by_name.get(player_o.name) is player_o:
+            del self.players_by_name[player_o.name]
+            return True
+        return False
+
+    def create_player(self,  player_name: str, player_color="red"):
         # check if player already exists. if so do not create a new one
         op_check = self.get_player_by_name(player_name)
         if op_check is None:
             player_o = Player(player_name, self.world_to_objects_interface, self)
+            player_o.color = player_color
             return player_o
         return None
 
-    def add_player_by_name(self,  player_name: str):
+    def add_player_by_name(self,  player_name: str, player_color="red"):
         # create a player object
-        player_o = self.create_player(player_name)
+        player_o = self.create_player(player_name, player_color)
         if player_o is not None:
-            print(f"Adding player to game: {player_o}.\n\t{self}")
+            print(f"Adding player to game: {player_o}.")
             return 1
         else:
             print(f"Player with name {player_name} already exists.")
@@ -284,30 +460,86 @@ class WorldToPlayersInterface:
     def remove_player_by_name(self, player_name: str):
         # get the player object by name
         player_to_remove: Player = self.get_player_by_name(player_name)
-        if player_to_remove in self.players_list:
+        if player_to_remove is not None:
             player_to_remove.__del__()
-            print(f"Removing player from game: {player_name}.\n\t{self}")
+            print(f"Removing player from game: {player_name}.")
             return 1
         return 0
 
+    def queue_player_inputs(self, player_name, player_inputs):
+        # player_inputs are dicts with sequence, thrust, rotate and shoot. stale or repeated inputs are ignored
+        player_to_update = self.get_player_by_name(player_name)
+        if player_to_update is None:
+            return 0
+
+        for player_input in player_inputs:
+            if player_input["sequence"] > player_to_update.last_queued_input:
+                player_to_update.pending_inputs.append(player_input)
+                player_to_update.last_queued_input = player_input["sequence"]
+        return 1
+
     def update_player(self, player_name, updated_player_data):
+        # clients only choose how their player looks. the battleship is moved by queued inputs alone,
+        # so no client can set its own position, angle or velocity
         player_to_update = self.get_player_by_name(player_name)
 
         if player_to_update is not None:
-            # update the battleship position
-            player_to_update.world_battleship.position = updated_player_data["battleship position"]
             player_to_update.color = updated_player_data["color"]
-            player_to_update.world_battleship.angle = updated_player_data["battleship_angle"]
-            player_to_update.world_battleship.set_velocity(updated_player_data["battleship_velocity_magnitude"])
             return 1
         return 0
 
 
     def __str__(self):
-        str_v = "[" +  ", ".join([str(p) for p in self.players_list]) + "]"
+        str_v = "[" +  ", ".join([str(p) for p in self.players_by_name.values()]) + "]"
         return f"List of players: {str_v}"
 
 
+#############################################################################
+
+# this starts the spatial index used for collision checks
+
+#############################################################################
+
+class SpatialHash:
+    # uniform grid keyed by cell. with the cell size equal to the collision radius,
+    # anything within that radius of a position lies in the position's cell or one of its 8 neighbours
+    def __init__(self, cell_size=10):
+        self.cell_size = cell_size
+        self.cells: dict[tuple[int, int], list] = {}
+
+    def clear(self):
+        self.cells.clear()
+
+    def get_cell(self, position):
+        cell_size = self.cell_size
+        return int(position[0] // cell_size), int(position[1] // cell_size)
+
+    def insert(self, item, position):
+        cell = self.get_cell(position)
+        bucket = self.cells.get(cell)
+        if bucket is None:
+            self.cells[cell] = [item]
+        else:
+            bucket.append(item)
+
+    def query_neighbours(self, position, cell_radius=1):
+        return self.query_cell_block(self.get_cell(position), cell_radius)
+
+    def query_cell_block(self, cell, cell_radius=1):
+        # everything in the square of cells reaching cell_radius cells out from cell
+        cell_x, cell_y = cell
+        cells = self.cells
+        cell_offsets = range(-cell_radius, cell_radius + 1)
+        for dx in cell_offsets:
+            for dy in cell_offsets:
+                bucket = cells.get((cell_x + dx, cell_y + dy))
+                if bucket is not None:
+                    yield from bucket
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.cells.values())
+
+
 #############################################################################
 
 # this starts the main server world
@@ -316,9 +548,12 @@ class WorldToPlayersInterface:
 
 
 class ServerDataInterface:
-    def __init__(self):
+    def __init__(self, world_to_objects_interface: WorldToObjectsInterface | None = None):
 
-        self.world_to_objects_interface = WorldToObjectsInterface()
+        # the objects interface decides how world objects are stored. defaults to plain python objects
+        if world_to_objects_interface is None:
+            world_to_objects_interface = WorldToObjectsInterface()
+        self.world_to_objects_interface = world_to_objects_interface
         self.world_to_players_interface = WorldToPlayersInterface(self.world_to_objects_interface)
 
     def get_player_object(self, player_name: str):
@@ -329,10 +564,27 @@ class ServerDataInterface:
 
 
 class ServerWorld:
-    def __init__(self, server_data_interface: ServerDataInterface):
+    def __init__(self, server_data_interface: ServerDataInterface, tick_rate=30, max_bullet_lifetime=5.0,
+                 arena_size=(800, 600)):
         # plug in external data interface
         self.server_data_interface = server_data_interface
 
+        # the world advances in fixed ticks. all game timings are expressed in ticks
+        self.tick_rate = tick_rate
+
+        # bullets are reclaimed once they are older than max_bullet_lifetime seconds or leave the arena.
+        # the arena matches the client screen by default
+        self.max_bullet_lifetime = max_bullet_lifetime
+        self.arena_size = arena_size
+
+        # bullets within this distance of a battleship count as a hit
+        self.collision_radius = 10
+        self.player_grid = SpatialHash(cell_size=self.collision_radius)
+
+        # seconds each phase of the last tick took, for the server metrics
+        self.phase_durations = {"apply_player_inputs": 0.0, "update_objects": 0.0,
+                                "enforce_environment_constraints": 0.0}
+
     def initialize(self):
         server_data_interface = self.server_data_interface
 
@@ -340,47 +592,110 @@ class ServerWorld:
         for game_object_x in game_objects:
             server_data_interface.world_to_objects_interface.add_game_object(game_object_x)
 
+    def get_current_tick(self):
+        return self.server_data_interface.world_to_objects_interface.current_tick
+
+    def seconds_to_ticks(self, seconds):
+        return round(seconds * self.tick_rate)
+
+    def find_collisions(self, all_players, all_bullets, current_tick):
+        # check if min time has elapsed after bullet activation.
+        # this is to prevent collision registering with player who shoots it
+        min_ticks_to_elapse_for_bullet = self.seconds_to_ticks(0.3)
+        separation_distance_squared = self.collision_radius * self.collision_radius
+
+        # rebuild the player grid for this tick. bullets then only look at players in neighbouring cells
+        player_grid = self.player_grid
+        player_grid.clear()
+        for player_p in all_players:
+            player_grid.insert(player_p, player_p.world_battleship.position)
+
+        players_hit, bullets_hit = [], []
+        for bullet_b in all_bullets:
+            if current_tick - bullet_b.activation_tick < min_ticks_to_elapse_for_bullet:
+                continue
+            bullet_x, bullet_y = bullet_b.position
+            for player_p in player_grid.query_neighbours(bullet_b.position):
+                player_x, player_y = player_p.world_battleship.position
+                dx, dy = bullet_x - player_x, bullet_y - player_y
+                if dx * dx + dy * dy <= separation_distance_squared:
+                    if bullet_b not in bullets_hit:
+                        bullets_hit.append(bullet_b)
+                    if player_p not in players_hit:
+                        players_hit.append(player_p)
+        return bullets_hit, players_hit
+
+    def find_spent_bullets(self, all_bullets, current_tick):
+        max_bullet_lifetime_ticks = self.seconds_to_ticks(self.max_bullet_lifetime)
+        arena_width, arena_height = self.arena_size
+
+        spent_bullets = []
+        for bullet_b in all_bullets:
+            bullet_x, bullet_y = bullet_b.position
+            if (current_tick - bullet_b.activation_tick >= max_bullet_lifetime_ticks
+                    or not (0 <= bullet_x <= arena_width and 0 <= bullet_y <= arena_height)):
+                spent_bullets.append(bullet_b)
+        return spent_bullets
+
+    def reclaim_spent_bullets(self):
+        objects_interface_v = self.server_data_interface.world_to_objects_interface
+        spent_bullets = self.find_spent_bullets(objects_interface_v.get_bullets(get_only_activated=True),
+                                                self.get_current_tick())
+        for bullet_b in spent_bullets:
+            objects_interface_v.release_bullet(bullet_b)
+
     def enforce_environment_constraints(self):
         objects_interface_v = self.server_data_interface.world_to_objects_interface
         players_interface_v = self.server_data_interface.world_to_players_interface
+
+        # expired bullets go back to the pool before they are checked for hits
+        self.reclaim_spent_bullets()
         all_players, all_bullets = (players_interface_v.get_all_players(),
                                     objects_interface_v.get_bullets(get_only_activated=True))
 
-        def check_for_collision(a_position, b_position, separation_distance_for_collision=10):
-            dx, dy = a_position[0] - b_position[0], a_position[1] - b_position[1]
-            distance_between_positions = math.sqrt((dx**2) + (dy**2))
-            distance_between_positions = round(distance_between_positions, 2)
-            if distance_between_positions <= separation_distance_for_collision:
-                return True
-            return False
-
         # if bullet hits player remove the player
-        for player_p in all_players:
-            for bullet_b in all_bullets:
-                # check if min time has elapsed after bullet activation.
-                # this is to prevent collision registering with player who shoots it
-                min_time_to_elapse_for_bullet = 0.3
-                if time.time() - bullet_b.activation_time >= min_time_to_elapse_for_bullet:
-                    bullet_has_collided_with_player = check_for_collision(bullet_b.position,
-                                                                          player_p.world_battleship.position)
-                    if bullet_has_collided_with_player:
-                        # remove the player and remove the bullet
-                        # todo add player life to 3
-                        bullet_b.__del__()
-                        player_p.__del__()
-                        print(f"bullet collision with player {player_p}".upper())
-
+        bullets_hit, players_hit = self.find_collisions(all_players, all_bullets, self.get_current_tick())
 
-    def update(self):
-        server_data_interface = self.server_data_interface
+        # remove the player and remove the bullet
+        # todo add player life to 3
+        for bullet_b in bullets_hit:
+            objects_interface_v.release_bullet(bullet_b)
+        for player_p in players_hit:
+            player_p.__del__()
+            print(f"bullet collision with player {player_p}".upper())
 
+    def update_objects(self):
         # update all objects
-        for world_object_o in server_data_interface.world_to_objects_interface.get_objects():
+        for world_object_o in self.server_data_interface.world_to_objects_interface.objects_registry.values():
             world_object_o.update()
 
+    def apply_player_inputs(self):
+        for player_p in self.server_data_interface.world_to_players_interface.get_all_players():
+            # inputs are only queued by world commands on this thread, so the list can be walked then cleared
+            pending_inputs = player_p.pending_inputs
+            if not pending_inputs:
+                continue
+            for player_input in pending_inputs:
+                player_p.world_battleship.apply_input(player_input["thrust"], player_input["rotate"],
+                                                      player_input["shoot"])
+            player_p.last_processed_input = pending_inputs[-1]["sequence"]
+            pending_inputs.clear()
+
+    def update(self):
+        self.server_data_interface.world_to_objects_interface.current_tick += 1
+        phase_durations = self.phase_durations
+        phase_start_time = time.perf_counter()
+        self.apply_player_inputs()
+        inputs_applied_time = time.perf_counter()
+        self.update_objects()
+        objects_updated_time = time.perf_counter()
+
         # todo game mechanics goes here
         self.enforce_environment_constraints()
-        pass
+
+        phase_durations["apply_player_inputs"] = inputs_applied_time - phase_start_time
+        phase_durations["update_objects"] = objects_updated_time - inputs_applied_time
+        phase_durations["enforce_environment_constraints"] = time.perf_counter() - objects_updated_time
 
 
 
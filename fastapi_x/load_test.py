@@ -0,0 +1,140 @@
+import time
+import asyncio
+import argparse
+
+import httpx
+
+from benchmark import print_table
+
+
+#############################################################################
+
+# this starts the load test helpers
+
+#############################################################################
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def summarize_latencies(phase_name, latencies_ms):
+    sorted_latencies = sorted(latencies_ms)
+    return {"phase": phase_name,
+            "requests": len(sorted_latencies),
+            "p50_ms": percentile(sorted_latencies, 0.50),
+            "p95_ms": percentile(sorted_latencies, 0.95),
+            "p99_ms": percentile(sorted_latencies, 0.99),
+            "max_ms": sorted_latencies[-1] if sorted_latencies else 0.0}
+
+
+def build_player_data(player_name):
+    return {"client_name": player_name,
+            "battleship_position": [400.0, 300.0],
+            "player_color": "red",
+            "battleship_angle": 0.0,
+            "battleship_velocity_magnitude": 0.0}
+
+
+#############################################################################
+
+# this starts the load test
+
+#############################################################################
+
+DEFAULT_STORM_RATE = 100
+
+
+class SendDataLoadTest:
+    # steady players keep sending /send_data while a storm of other players joins and leaves.
+    # each /send_data latency is filed under the phase it started in. storm joins are timed too,
+    # but only the admitted ones. joins turned away because every arena is full are just counted
+    def __init__(self, http_client: httpx.AsyncClient, steady_players=20, send_rate=10):
+        self.http_client = http_client
+        self.steady_players = steady_players
+        self.send_interval = 1 / send_rate
+        self.phase = "quiet"
+        self.latencies_ms: dict[str, list[float]] = {"quiet": [], "join storm": []}
+        self.join_latencies_ms: list[float] = []
+        self.rejected_join_count = 0
+        self.stop_requested = False
+
+    async def send_player_data(self, player_name):
+        player_data = build_player_data(player_name)
+        while not self.stop_requested:
+            phase = self.phase
+            start_time = time.perf_counter()
+            await self.http_client.post("send_data", params={"player_name": player_name}, json=player_data)
+            self.latencies_ms[phase].append((time.perf_counter() - start_time) * 1000)
+            await asyncio.sleep(self.send_interval)
+
+    async def join_and_leave(self, player_name):
+        start_time = time.perf_counter()
+        enter_response = await self.http_client.get("enter", params={"player_name": player_name})
+        join_latency_ms = (time.perf_counter() - start_time) * 1000
+        if not enter_response.json().get("joined"):
+            self.rejected_join_count += 1
+            return
+        self.join_latencies_ms.append(join_latency_ms)
+        await self.http_client.get("get_my_data", params={"player_name": player_name})
+        await self.http_client.get("exit", params={"player_name": player_name})
+
+    async def run(self, quiet_seconds=3.0, storm_players=500, storm_rate=DEFAULT_STORM_RATE):
+        steady_names = [f"steady_{player_index}" for player_index in range(self.steady_players)]
+        for player_name in steady_names:
+            enter_response = await self.http_client.get("enter", params={"player_name": player_name})
+            if not enter_response.json().get("joined"):
+                print(f"[WARNING] (LOAD TEST) - Steady player {player_name} was not admitted: "
+                      f"{enter_response.json().get('message')}")
+        sender_tasks = [asyncio.create_task(self.send_player_data(player_name)) for player_name in steady_names]
+
+        await asyncio.sleep(quiet_seconds)
+
+        # storm players arrive at storm_rate per second, without waiting for earlier ones to get in
+        self.phase = "join storm"
+        storm_start_time = time.perf_counter()
+        storm_tasks = []
+        for player_index in range(storm_players):
+            storm_tasks.append(asyncio.create_task(self.join_and_leave(f"storm_{player_index}")))
+            await asyncio.sleep(max(storm_start_time + (player_index + 1) / storm_rate - time.perf_counter(), 0))
+        await asyncio.gather(*storm_tasks)
+        storm_duration = time.perf_counter() - storm_start_time
+
+        self.stop_requested = True
+        await asyncio.gather(*sender_tasks)
+        for player_name in steady_names:
+            await self.http_client.get("exit", params={"player_name": player_name})
+
+        results = [summarize_latencies(phase_name, latencies_ms)
+                   for phase_name, latencies_ms in self.latencies_ms.items()]
+        results.append(summarize_latencies("admitted /enter", self.join_latencies_ms))
+        return results, storm_duration
+
+
+async def run_load_test(server_url, steady_players, send_rate, quiet_seconds, storm_players, storm_rate):
+    limits = httpx.Limits(max_connections=steady_players + storm_players)
+    async with httpx.AsyncClient(base_url=server_url, limits=limits, timeout=30) as http_client:
+        load_test = SendDataLoadTest(http_client, steady_players, send_rate)
+        results, storm_duration = await load_test.run(quiet_seconds, storm_players, storm_rate)
+        return results, storm_duration, load_test.rejected_join_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /send_data latency on a running server during a join storm")
+    parser.add_argument("--server-url", default="http://127.0.0.1:8000/")
+    parser.add_argument("--steady-players", type=int, default=20)
+    parser.add_argument("--send-rate", type=float, default=10, help="/send_data requests per second per player")
+    parser.add_argument("--quiet-seconds", type=float, default=3.0)
+    parser.add_argument("--storm-players", type=int, default=500)
+    parser.add_argument("--storm-rate", type=float, default=DEFAULT_STORM_RATE,
+                        help="players joining per second during the storm")
+    args = parser.parse_args()
+
+    results, storm_duration_v, rejected_join_count_v = asyncio.run(
+        run_load_test(args.server_url, args.steady_players, args.send_rate,
+                      args.quiet_seconds, args.storm_players, args.storm_rate))
+    print(f"[INFO] (LOAD TEST) - {args.storm_players - rejected_join_count_v} of {args.storm_players} storm players "
+          f"joined and left in {storm_duration_v:.1f} s, {rejected_join_count_v} were turned away by full arenas")
+    print("[INFO] (LOAD TEST) - /send_data latency per phase, then the latency of the admitted storm joins")
+    print_table(results, ["phase", "requests", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
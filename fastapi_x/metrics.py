@@ -0,0 +1,148 @@
+import bisect
+import threading
+
+
+#############################################################################
+
+# this starts the metric primitives
+
+#############################################################################
+
+class Histogram:
+    # histogram with fixed bucket upper bounds. the last bucket catches everything above the bounds
+    def __init__(self, bucket_bounds):
+        self.bucket_bounds = tuple(sorted(bucket_bounds))
+        self.bucket_counts = [0] * (len(self.bucket_bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max_value = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        bucket_index = bisect.bisect_left(self.bucket_bounds, value)
+        with self._lock:
+            self.bucket_counts[bucket_index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max_value:
+                self.max_value = value
+
+    def get_mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        with self._lock:
+            buckets = {f"le_{bound}": count for bound, count in zip(self.bucket_bounds, self.bucket_counts)}
+            buckets["le_inf"] = self.bucket_counts[-1]
+            return {"count": self.count, "sum": self.total, "mean": self.get_mean(), "max": self.max_value,
+                    "buckets": buckets}
+
+
+class Counter:
+    # a count that only goes up
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def to_dict(self):
+        return {"value": self.value}
+
+
+class MetricFamily:
+    # one metric per set of label values, made on first use. label values are passed in label_names order
+    def __init__(self, label_names, make_metric):
+        self.label_names = tuple(label_names)
+        self.make_metric = make_metric
+        self.metrics: dict[tuple, Histogram | Counter] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *label_values):
+        metric = self.metrics.get(label_values)
+        if metric is None:
+            with self._lock:
+                metric = self.metrics.setdefault(label_values, self.make_metric())
+        return metric
+
+    def to_dict(self):
+        # label values joined by "/" -> the metric as a dict. plain data, so it can cross process pipes
+        return {"/".join(label_values): metric.to_dict() for label_values, metric in list(self.metrics.items())}
+
+
+#############################################################################
+
+# this starts the prometheus text exposition
+
+#############################################################################
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict | None):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{label_name}="{escape_label_value(label_value)}"'
+                          for label_name, label_value in labels.items()) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class PrometheusExposition:
+    # collects samples by metric name, so that every metric is written once with its HELP and TYPE lines
+    # and all of its samples together, whichever arena or label they came from
+    def __init__(self, namespace="pantheon"):
+        self.namespace = namespace
+        self.metrics: dict[str, tuple[str, str, list[str]]] = {}
+
+    def get_sample_lines(self, name, metric_type, help_text):
+        metric_name = f"{self.namespace}_{name}"
+        if metric_name not in self.metrics:
+            self.metrics[metric_name] = (metric_type, help_text, [])
+        return metric_name, self.metrics[metric_name][2]
+
+    def add_gauge(self, name, help_text, value, labels=None):
+        metric_name, sample_lines = self.get_sample_lines(name, "gauge", help_text)
+        sample_lines.append(f"{metric_name}{format_labels(labels)} {format_value(value)}")
+
+    def add_counter(self, name, help_text, value, labels=None):
+        metric_name, sample_lines = self.get_sample_lines(f"{name}_total", "counter", help_text)
+        sample_lines.append(f"{metric_name}{format_labels(labels)} {format_value(value)}")
+
+    def add_histogram(self, name, help_text, histogram_dict: dict, labels=None):
+        # histogram_dict as made by Histogram.to_dict. prometheus buckets are cumulative
+        metric_name, sample_lines = self.get_sample_lines(name, "histogram", help_text)
+        labels = labels or {}
+        cumulative_count = 0
+        for bucket_name, bucket_count in histogram_dict["buckets"].items():
+            cumulative_count += bucket_count
+            upper_bound = bucket_name[len("le_"):]
+            upper_bound = "+Inf" if upper_bound == "inf" else upper_bound
+            sample_lines.append(f"{metric_name}_bucket{format_labels({**labels, 'le': upper_bound})} "
+                                f"{cumulative_count}")
+        sample_lines.append(f"{metric_name}_sum{format_labels(labels)} {format_value(histogram_dict['sum'])}")
+        sample_lines.append(f"{metric_name}_count{format_labels(labels)} {histogram_dict['count']}")
+
+    def add_family(self, name, help_text, family: MetricFamily, labels=None):
+        # every metric of the family, labelled with its label values and labels
+        for label_values, metric in list(family.metrics.items()):
+            metric_labels = {**(labels or {}), **dict(zip(family.label_names, label_values))}
+            if isinstance(metric, Histogram):
+                self.add_histogram(name, help_text, metric.to_dict(), metric_labels)
+            else:
+                self.add_counter(name, help_text, metric.value, metric_labels)
+
+    def render(self):
+        lines = []
+        for metric_name, (metric_type, help_text, sample_lines) in self.metrics.items():
+            lines.append(f"# HELP {metric_name} {help_text}")
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+            lines.extend(sample_lines)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import threading
+import collections
+
+
+#############################################################################
+
+# this starts the sampling profiler
+
+#############################################################################
+
+class SamplingProfiler:
+    # while running, takes the stack of every thread in this process every sample_interval seconds
+    # and counts how often each stack was seen. the counts come out as folded stacks,
+    # one "outermost;...;innermost count" line per stack, which flame graph tools read as they are.
+    # it only ever reads frames, so it can be started and stopped while the server is under load
+    def __init__(self, sample_interval=0.01, max_stack_depth=48):
+        self.sample_interval = sample_interval
+        self.max_stack_depth = max_stack_depth
+
+        self.stack_counts: collections.Counter[str] = collections.Counter()
+        self.sample_count = 0
+        self._lock = threading.Lock()
+        # start and stop can come in from several worker threads at once
+        self._control_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sampler_thread = None
+
+    def is_running(self):
+        return self._sampler_thread is not None and self._sampler_thread.is_alive()
+
+    def start(self):
+        with self._control_lock:
+            if self.is_running():
+                return
+            self._stop_event.clear()
+            self._sampler_thread = threading.Thread(target=self.run, name="sampling_profiler", daemon=True)
+            self._sampler_thread.start()
+
+    def stop(self):
+        with self._control_lock:
+            self._stop_event.set()
+            if self._sampler_thread is not None:
+                self._sampler_thread.join()
+                self._sampler_thread = None
+
+    def reset(self):
+        with self._lock:
+            self.stack_counts.clear()
+            self.sample_count = 0
+
+    def fold_stack(self, frame, thread_name):
+        frame_names = []
+        while frame is not None and len(frame_names) < self.max_stack_depth:
+            code = frame.f_code
+            frame_names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        frame_names.append(thread_name)
+        return ";".join(reversed(frame_names))
+
+    def take_sample(self):
+        sampler_thread_id = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        folded_stacks = [self.fold_stack(frame, thread_names.get(thread_id, f"thread_{thread_id}"))
+                         for thread_id, frame in sys._current_frames().items() if thread_id != sampler_thread_id]
+        with self._lock:
+            self.stack_counts.update(folded_stacks)
+            self.sample_count += 1
+
+    def run(self):
+        while not self._stop_event.is_set():
+            sample_start_time = time.perf_counter()
+            self.take_sample()
+            self._stop_event.wait(max(self.sample_interval - (time.perf_counter() - sample_start_time), 0))
+
+    def get_folded_stacks(self, limit=None):
+        # the most seen stacks first
+        with self._lock:
+            return self.stack_counts.most_common(limit)
+
+    def get_stats(self):
+        return {"running": self.is_running(),
+                "sample_interval": self.sample_interval,
+                "sample_count": self.sample_count,
+                "distinct_stacks": len(self.stack_counts)}
+
+    def handle_request(self, action, limit=None):
+        # "start", "stop", "reset", "stats" or "stacks".
+        # the same requests drive the server's own profiler and those of the arena processes
+        if action == "stacks":
+            return self.get_folded_stacks(limit)
+        if action == "start":
+            self.start()
+        elif action == "stop":
+            self.stop()
+        elif action == "reset":
+            self.reset()
+        elif action != "stats":
+            raise ValueError(f"Unknown profiler action {action}.")
+        return self.get_stats()
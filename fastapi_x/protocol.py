@@ -0,0 +1,228 @@
+import struct
+
+
+#############################################################################
+
+# this starts the compact binary wire format shared by server and client
+
+#############################################################################
+
+# bump this whenever a layout below changes. decoders refuse messages of any other version
+WIRE_FORMAT_VERSION = 5
+BINARY_MEDIA_TYPE = "application/x-pantheon"
+
+MESSAGE_WORLD_UPDATE = 1
+MESSAGE_PLAYER_STATE = 2
+
+FLAG_KEYFRAME = 0b001
+FLAG_KILLED = 0b010
+FLAG_OWN_STATE = 0b100
+
+# positions are sent as fixed point int32 in 1/8 units. that covers +-268 million units around the origin,
+# positions beyond it are clamped
+POSITION_SCALE = 8
+POSITION_LIMIT = 2 ** 31 - 1
+# angles map onto the full uint16 range, velocities are int16 in 1/100 units
+ANGLE_SCALE = 65536 / 360
+VELOCITY_SCALE = 100
+
+# version, message type, flags, tick, changed players, removed players, changed bullets, removed bullets,
+# distant summary cells
+WORLD_UPDATE_HEADER = struct.Struct("<BBBIHHHHH")
+# version, message type, position x, position y, angle, velocity magnitude, bullets left
+PLAYER_STATE_HEADER = struct.Struct("<BBiiHhB")
+POSITION = struct.Struct("<ii")
+# bullet id, position x, position y, velocity x, velocity y
+BULLET = struct.Struct("<Iiihh")
+BULLET_ID = struct.Struct("<I")
+# cell center x, cell center y, players, bullets
+SUMMARY_CELL = struct.Struct("<iiHH")
+# last processed input, position x, position y, angle, velocity magnitude, bullets left
+OWN_STATE = struct.Struct("<IiiHhB")
+
+# offset of the flags byte, so the per client flags can be set on shared bytes
+FLAGS_OFFSET = 2
+
+# strings such as player names are sent with a one byte length
+MAX_STRING_BYTES = 255
+
+# the last processed input goes out as uint32 in OWN_STATE, so input sequence numbers must fit one
+MAX_INPUT_SEQUENCE = 2 ** 32 - 1
+
+
+def quantize_position(position):
+    return tuple(max(-POSITION_LIMIT, min(POSITION_LIMIT, round(value * POSITION_SCALE))) for value in position)
+
+
+def dequantize_position(quantized_position):
+    return [value / POSITION_SCALE for value in quantized_position]
+
+
+def quantize_velocity(velocity):
+    return tuple(max(-32768, min(32767, round(value * VELOCITY_SCALE))) for value in velocity)
+
+
+def dequantize_velocity(quantized_velocity):
+    return [value / VELOCITY_SCALE for value in quantized_velocity]
+
+
+def quantize_angle(angle):
+    return round((angle % 360) * ANGLE_SCALE) % 65536
+
+
+def dequantize_angle(quantized_angle):
+    return quantized_angle / ANGLE_SCALE
+
+
+def pack_string(value: str):
+    # at most MAX_STRING_BYTES. a character cut in half by the limit is dropped, so the rest still decodes
+    value_bytes = value.encode()[:MAX_STRING_BYTES].decode(errors="ignore").encode()
+    return bytes([len(value_bytes)]) + value_bytes
+
+
+def unpack_string(data, offset):
+    length = data[offset]
+    offset += 1
+    return data[offset:offset + length].decode(), offset + length
+
+
+def check_header(version, message_type, expected_message_type):
+    if version != WIRE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported wire format version {version}. Expected {WIRE_FORMAT_VERSION}.")
+    if message_type != expected_message_type:
+        raise ValueError(f"Unexpected message type {message_type}. Expected {expected_message_type}.")
+
+
+#############################################################################
+
+# this starts the world update message
+
+#############################################################################
+
+def encode_world_update(tick, keyframe, changed_players: dict, removed_players: list,
+                        changed_bullets: dict, removed_bullets: list, distant_summary=()):
+    # same content as the json world update. the per client part is added by attach_your_data
+    flags = FLAG_KEYFRAME if keyframe else 0
+    parts = [WORLD_UPDATE_HEADER.pack(WIRE_FORMAT_VERSION, MESSAGE_WORLD_UPDATE, flags, tick,
+                                      len(changed_players), len(removed_players),
+                                      len(changed_bullets), len(removed_bullets), len(distant_summary))]
+    for player_name, player_data in changed_players.items():
+        parts.append(pack_string(player_name))
+        parts.append(pack_string(player_data["color"]))
+        parts.append(POSITION.pack(*quantize_position(player_data["battleship_position"])))
+    for player_name in removed_players:
+        parts.append(pack_string(player_name))
+    for bullet_id, bullet_data in changed_bullets.items():
+        parts.append(BULLET.pack(bullet_id, *quantize_position(bullet_data[:2]), *quantize_velocity(bullet_data[2:])))
+    for bullet_id in removed_bullets:
+        parts.append(BULLET_ID.pack(bullet_id))
+    for center_x, center_y, player_count, bullet_count in distant_summary:
+        parts.append(SUMMARY_CELL.pack(*quantize_position((center_x, center_y)),
+                                       min(player_count, 65535), min(bullet_count, 65535)))
+    return b"".join(parts)
+
+
+def attach_your_data(encoded_world_update: bytes, your_data: dict):
+    # sets the per client flags on the shared bytes and appends the state of the client's own battleship, if known
+    flags = encoded_world_update[FLAGS_OFFSET] & FLAG_KEYFRAME
+    own_state = b""
+    if your_data["killed"]:
+        flags |= FLAG_KILLED
+    elif "last_processed_input" in your_data:
+        flags |= FLAG_OWN_STATE
+        own_state = OWN_STATE.pack(your_data["last_processed_input"],
+                                   *quantize_position(your_data["battleship_position"]),
+                                   quantize_angle(your_data["battleship_angle"]),
+                                   *quantize_velocity((your_data["battleship_velocity_magnitude"],)),
+                                   min(your_data["bullets_left"], 255))
+    return (encoded_world_update[:FLAGS_OFFSET] + bytes([flags]) + encoded_world_update[FLAGS_OFFSET + 1:]
+            + own_state)
+
+
+def decode_world_update(data: bytes):
+    # decodes into the same shape as the json world update. bullet ids are strings, as they are in json
+    (version, message_type, flags, tick, changed_player_count, removed_player_count,
+     changed_bullet_count, removed_bullet_count, summary_cell_count) = WORLD_UPDATE_HEADER.unpack_from(data, 0)
+    check_header(version, message_type, MESSAGE_WORLD_UPDATE)
+    offset = WORLD_UPDATE_HEADER.size
+
+    changed_players = {}
+    for _ in range(changed_player_count):
+        player_name, offset = unpack_string(data, offset)
+        player_color, offset = unpack_string(data, offset)
+        position = dequantize_position(POSITION.unpack_from(data, offset))
+        offset += POSITION.size
+        changed_players[player_name] = {"name": player_name, "battleship_position": position, "color": player_color}
+
+    removed_players = []
+    for _ in range(removed_player_count):
+        player_name, offset = unpack_string(data, offset)
+        removed_players.append(player_name)
+
+    changed_bullets = {}
+    for _ in range(changed_bullet_count):
+        bullet_id, x, y, velocity_x, velocity_y = BULLET.unpack_from(data, offset)
+        offset += BULLET.size
+        changed_bullets[str(bullet_id)] = dequantize_position((x, y)) + dequantize_velocity((velocity_x, velocity_y))
+
+    removed_bullets = []
+    for _ in range(removed_bullet_count):
+        removed_bullets.append(BULLET_ID.unpack_from(data, offset)[0])
+        offset += BULLET_ID.size
+
+    distant_summary = []
+    for _ in range(summary_cell_count):
+        x, y, player_count, bullet_count = SUMMARY_CELL.unpack_from(data, offset)
+        offset += SUMMARY_CELL.size
+        distant_summary.append([*dequantize_position((x, y)), player_count, bullet_count])
+
+    your_data = {"killed": bool(flags & FLAG_KILLED)}
+    if flags & FLAG_OWN_STATE:
+        last_processed_input, x, y, quantized_angle, velocity_magnitude, bullets_left = OWN_STATE.unpack_from(data, offset)
+        your_data.update({"last_processed_input": last_processed_input,
+                          "battleship_position": dequantize_position((x, y)),
+                          "battleship_angle": dequantize_angle(quantized_angle),
+                          "battleship_velocity_magnitude": velocity_magnitude / VELOCITY_SCALE,
+                          "bullets_left": bullets_left})
+
+    return {"tick": tick,
+            "keyframe": bool(flags & FLAG_KEYFRAME),
+            "opponent_player_data": changed_players,
+            "removed_opponents": removed_players,
+            "bullets": changed_bullets,
+            "removed_bullets": removed_bullets,
+            "distant_summary": distant_summary,
+            "your_data": your_data}
+
+
+#############################################################################
+
+# this starts the player state message
+
+#############################################################################
+
+def encode_player_state(player_o):
+    # only what the client needs to rebuild its own player. never the rest of the world
+    battleship_o = player_o.world_battleship
+    velocity_magnitude, = quantize_velocity((battleship_o.get_velocity(),))
+    header = PLAYER_STATE_HEADER.pack(WIRE_FORMAT_VERSION, MESSAGE_PLAYER_STATE,
+                                      *quantize_position(battleship_o.position),
+                                      quantize_angle(battleship_o.get_angle()),
+                                      velocity_magnitude,
+                                      min(battleship_o.bullets_left, 255))
+    return header + pack_string(player_o.name) + pack_string(player_o.color)
+
+
+def decode_player_state(data: bytes):
+    (version, message_type, x, y, quantized_angle,
+     velocity_magnitude, bullets_left) = PLAYER_STATE_HEADER.unpack_from(data, 0)
+    check_header(version, message_type, MESSAGE_PLAYER_STATE)
+    offset = PLAYER_STATE_HEADER.size
+    player_name, offset = unpack_string(data, offset)
+    player_color, offset = unpack_string(data, offset)
+    return {"name": player_name,
+            "color": player_color,
+            "battleship_position": dequantize_position((x, y)),
+            "battleship_angle": dequantize_angle(quantized_angle),
+            "battleship_velocity_magnitude": velocity_magnitude / VELOCITY_SCALE,
+            "bullets_left": bullets_left}
@@ -1,15 +1,18 @@
-import pickle
-import threading
-from typing import Annotated
+import os
+import time
+import asyncio
+from typing import Annotated, Literal
 from datetime import datetime
 
-import pygame
-from fastapi import FastAPI
-from fastapi.responses import Response
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, Response
+from pydantic import BaseModel, Field, ValidationError
 from starlette.responses import HTMLResponse
 
-from game import ServerDataInterface, ServerWorld
+from arenas import ArenaManager, ArenaProcess, build_arenas
+from metrics import Counter, Histogram, MetricFamily, PrometheusExposition
+from profiler import SamplingProfiler
+from protocol import BINARY_MEDIA_TYPE, MAX_INPUT_SEQUENCE, MAX_STRING_BYTES
 
 
 print(f"Starting game server at {datetime.now()}!")
@@ -18,6 +21,52 @@ print(f"Starting game server at {datetime.now()}!")
 app = FastAPI()
 
 
+# request metrics, per route template and not per url, so that player names do not make new series
+http_requests = MetricFamily(["method", "path", "status"], Counter)
+http_request_duration_ms = MetricFamily(["method", "path"],
+                                        lambda: Histogram([0.5, 1, 2, 5, 10, 20, 50, 100, 250, 1000]))
+http_response_bytes = MetricFamily(["path"], lambda: Histogram([64, 256, 1024, 4096, 16384, 65536, 262144]))
+stream_messages_sent = Counter()
+stream_bytes_sent = Counter()
+
+
+class RequestMetricsMiddleware:
+    # plain asgi rather than an http middleware of fastapi, which would wrap every response in another stream
+    def __init__(self, asgi_app):
+        self.asgi_app = asgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.asgi_app(scope, receive, send)
+
+        start_time = time.perf_counter()
+        response_status, response_bytes = 500, 0
+
+        async def send_and_measure(message):
+            nonlocal response_status, response_bytes
+            if message["type"] == "http.response.start":
+                response_status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.asgi_app(scope, receive, send_and_measure)
+        finally:
+            # the router leaves the matched route in the scope
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            http_request_duration_ms.labels(scope["method"], path).observe((time.perf_counter() - start_time) * 1000)
+            http_requests.labels(scope["method"], path, str(response_status)).inc()
+            http_response_bytes.labels(path).observe(response_bytes)
+
+
+app.add_middleware(RequestMetricsMiddleware)
+
+# world data can be sent as json or in the compact binary format of protocol.py
+WireFormat = Literal["json", "binary"]
+
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     return """
@@ -40,21 +89,55 @@ async def root():
 
 # initialize the main game objects
 
-data_interface = ServerDataInterface()
-objects_interface = data_interface.world_to_objects_interface
-players_interface = data_interface.world_to_players_interface
+# set PANTHEON_WORLD_STORE=arrays to keep the world in numpy arrays and run the ticks vectorized,
+# or PANTHEON_WORLD_STORE=compact for world objects that update in place
+world_store_kind = os.environ.get("PANTHEON_WORLD_STORE", "objects")
+
+# set PANTHEON_ARENAS to run that many independent arenas, each in its own process.
+# players are matched to an arena on /enter and all their requests are routed to it
+number_of_arenas = int(os.environ.get("PANTHEON_ARENAS", "1"))
+# players per arena. a single arena takes everyone unless PANTHEON_MAX_PLAYERS_PER_ARENA is set,
+# several arenas default to 50 each so that matches fill up one after another
+if "PANTHEON_MAX_PLAYERS_PER_ARENA" in os.environ:
+    max_players_per_arena = int(os.environ["PANTHEON_MAX_PLAYERS_PER_ARENA"])
+else:
+    max_players_per_arena = 50 if number_of_arenas > 1 else None
+
+# set PANTHEON_INTEREST_RADIUS to send each player only the entities around their battleship,
+# with a count of everything further away. the area sent is a square of grid cells around the player,
+# covering the radius and reaching at most 1.5 times it along each axis
+interest_radius = float(os.environ["PANTHEON_INTEREST_RADIUS"]) if "PANTHEON_INTEREST_RADIUS" in os.environ else None
+
+# set PANTHEON_PROFILER=1 to sample the server from the start. it can also be toggled at /profiler
+sampling_profiler = SamplingProfiler()
+if os.environ.get("PANTHEON_PROFILER") == "1":
+    sampling_profiler.start()
+
+# run the server game worlds at a fixed tick rate
+server_tick_rate = 30
+arena_manager = ArenaManager(build_arenas(number_of_arenas, world_store_kind, server_tick_rate, interest_radius),
+                             max_players_per_arena=max_players_per_arena)
+arena_manager.start()
 
-# run the server game world
-def run_server_world():
-    server_world = ServerWorld(data_interface)
-    clock = pygame.time.Clock()
-    game_over = False
-    while not game_over:
-        server_world.update()
-        clock.tick(30)
-t1 = threading.Thread(target=run_server_world, daemon=True)
-t1.start()
 
+def get_player_arena(player_name: str):
+    # players unknown to every arena are reported as killed by the first one
+    player_arena = arena_manager.get_arena(player_name)
+    return player_arena if player_arena is not None else arena_manager.arenas[0]
+
+
+# handlers give up on arena requests after this many seconds, so an arena that stopped answering fails
+# the request instead of hanging it. world commands given up on are dropped, unless already applied
+arena_request_timeout = 5.0
+
+
+async def wait_for_arena(arena_future):
+    return await asyncio.wait_for(asyncio.wrap_future(arena_future), timeout=arena_request_timeout)
+
+
+async def run_world_command(player_name: str, command_name: str, *args):
+    # waits for the tick that applies the command, so it costs the handler up to one tick
+    return await wait_for_arena(get_player_arena(player_name).submit_command(command_name, *args))
 
 
 # define server variables here
@@ -62,106 +145,290 @@ game_run_has_started = False
 
 
 @app.get("/enter")
-async def create_player(player_name: str):
-    operation_status = players_interface.add_player_by_name(player_name)
-    if operation_status:
-        print(f"Player {player_name} has joined the game!\n")
-        return {"player_data": f"successfully joined the game!"}
-    return {"player_data": f"player name already exists. please choose a new name."}
+async def create_player(player_name: str, player_color: str = "red"):
+    # "joined" tells clients whether they are in. player_data says why not
+    # names have to fit the binary wire format whole, clients find their own entry by it
+    if len(player_name.encode()) > MAX_STRING_BYTES:
+        return {"joined": False, "player_data": f"player name is too long. please choose a shorter name."}
+    arena_index = arena_manager.assign_arena(player_name)
+    if arena_index is None:
+        if arena_manager.get_arena(player_name) is None:
+            return {"joined": False, "player_data": f"all arenas are full. please try again later."}
+        return {"joined": False, "player_data": f"player name already exists. please choose a new name."}
+
+    joined = False
+    try:
+        operation_status = await run_world_command(player_name, "add_player", player_name, player_color)
+        if operation_status:
+            arena_manager.confirm_player(player_name)
+            joined = True
+            print(f"Player {player_name} has joined the game in arena {arena_index}!\n")
+            return {"joined": True, "player_data": f"successfully joined the game!"}
+        return {"joined": False, "player_data": f"player name already exists. please choose a new name."}
+    except BaseException:
+        # the add may still be applied after we stopped waiting. remove it again so no unowned player is left
+        arena_manager.arenas[arena_index].submit_command("remove_player", player_name)
+        raise
+    finally:
+        if not joined:
+            arena_manager.release_player(player_name)
 
 
 
 @app.get("/exit")
 async def player_exit(player_name: str):
-    operation_status = players_interface.remove_player_by_name(player_name)
+    if arena_manager.get_arena(player_name) is None:
+        return "player does not exist."
+    operation_status = await run_world_command(player_name, "remove_player", player_name)
+    arena_manager.release_player(player_name)
     if operation_status:
         print(f"Player {player_name} has left the game!\n")
         return "successfully exited from the game"
     return "player does not exist."
 
 
+@app.get("/tick_stats")
+async def get_tick_stats():
+    # the first arena at the top level, every arena under "arenas"
+    arena_stats = [await wait_for_arena(arena.request_stats()) for arena in arena_manager.arenas]
+    tick_stats = dict(arena_stats[0])
+    tick_stats["arenas"] = arena_stats
+    tick_stats["arena_player_counts"] = arena_manager.get_arena_player_counts()
+    return tick_stats
+
+
+def add_arena_metrics(exposition: PrometheusExposition, arena_stats: dict, arena_index: int):
+    arena_labels = {"arena": arena_index}
+    exposition.add_histogram("tick_duration_ms", "Wall time of whole ticks.", arena_stats["tick_duration_ms"],
+                             arena_labels)
+    for phase_name, histogram_dict in arena_stats["phase_duration_ms"].items():
+        exposition.add_histogram("tick_phase_duration_ms", "Wall time of each phase of a tick.", histogram_dict,
+                                 {**arena_labels, "phase": phase_name})
+    exposition.add_counter("ticks", "Ticks run.", arena_stats["tick_count"], arena_labels)
+    exposition.add_counter("tick_overruns", "Ticks that took longer than the tick interval.",
+                           arena_stats["overrun_count"], arena_labels)
+    exposition.add_counter("ticks_dropped", "Ticks skipped to catch up after overruns.",
+                           arena_stats["dropped_tick_count"], arena_labels)
+    exposition.add_counter("ticks_failed", "Ticks that raised.", arena_stats["failed_tick_count"], arena_labels)
+    exposition.add_gauge("world_tick", "Current world tick.", arena_stats["world_tick"], arena_labels)
+
+    exposition.add_gauge("players", "Players in the world.", arena_stats["players"], arena_labels)
+    exposition.add_gauge("bullets", "Bullets in flight.", arena_stats["bullets"], arena_labels)
+    bullet_pool_stats = arena_stats["bullet_pool"]
+    exposition.add_gauge("bullet_pool_in_use", "Pooled bullets handed out.", bullet_pool_stats["in_use"],
+                         arena_labels)
+    exposition.add_gauge("bullet_pool_free", "Pooled bullets waiting for reuse.", bullet_pool_stats["free"],
+                         arena_labels)
+
+    world_commands_stats = arena_stats["world_commands"]
+    exposition.add_gauge("world_commands_pending", "World commands waiting for the next tick.",
+                         world_commands_stats["pending"], arena_labels)
+    exposition.add_counter("world_commands_applied", "World commands applied.", world_commands_stats["applied"],
+                           arena_labels)
+    exposition.add_counter("world_commands_failed", "World commands that raised.", world_commands_stats["failed"],
+                           arena_labels)
+
+    for wire_format, histogram_dict in arena_stats["world_data_build_ms"].items():
+        exposition.add_histogram("world_data_build_ms", "Time to build the world data of one client.",
+                                 histogram_dict, {**arena_labels, "wire_format": wire_format})
+    for wire_format, histogram_dict in arena_stats["world_data_bytes"].items():
+        exposition.add_histogram("world_data_bytes", "Size of the world data sent to one client.",
+                                 histogram_dict, {**arena_labels, "wire_format": wire_format})
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # prometheus text format. http metrics are the server's, everything else is per arena
+    exposition = PrometheusExposition()
+    exposition.add_family("http_requests", "Requests handled.", http_requests)
+    exposition.add_family("http_request_duration_ms", "Time to handle a request.", http_request_duration_ms)
+    exposition.add_family("http_response_bytes", "Size of response bodies.", http_response_bytes)
+    exposition.add_counter("stream_messages_sent", "World updates pushed over websockets.",
+                           stream_messages_sent.value)
+    exposition.add_counter("stream_bytes_sent", "Bytes of world updates pushed over websockets.",
+                           stream_bytes_sent.value)
+
+    for arena_index, arena in enumerate(arena_manager.arenas):
+        add_arena_metrics(exposition, await wait_for_arena(arena.request_stats()), arena_index)
+    for arena_index, player_count in enumerate(arena_manager.get_arena_player_counts()):
+        exposition.add_gauge("arena_players", "Players matched to the arena.", player_count, {"arena": arena_index})
+    exposition.add_gauge("profiler_running", "1 while the sampling profiler runs.",
+                         int(sampling_profiler.is_running()))
+    return PlainTextResponse(exposition.render(), media_type="text/plain; version=0.0.4")
+
+
+# the sampling profiler of the server, and of every arena process. arena processes are profiled on their own,
+# their stacks start with the arena they came from
+async def run_profiler_action(action: str, limit: int | None = None):
+    # stopping joins the sampler thread and sorting the stacks takes a while, neither belongs on the event loop
+    results = [await asyncio.to_thread(sampling_profiler.handle_request, action, limit)]
+    for arena in arena_manager.arenas:
+        if isinstance(arena, ArenaProcess):
+            results.append(await wait_for_arena(arena.request_profiler(action, limit)))
+    return results
+
+
+@app.get("/profiler")
+async def toggle_profiler(enabled: bool | None = None, reset: bool = False):
+    # enabled=true starts sampling and enabled=false stops it. reset drops the stacks counted so far
+    if reset:
+        await run_profiler_action("reset")
+    if enabled is not None:
+        await run_profiler_action("start" if enabled else "stop")
+    profiler_stats, *arena_process_stats = await run_profiler_action("stats")
+    profiler_stats["arena_processes"] = arena_process_stats
+    return profiler_stats
+
+
+@app.get("/profiler/stacks", response_class=PlainTextResponse)
+async def get_profiler_stacks(limit: int = 200):
+    # folded stacks, ready for flamegraph.pl or speedscope
+    server_stacks, *arena_stacks = await run_profiler_action("stacks", limit)
+    lines = [f"server;{folded_stack} {count}" for folded_stack, count in server_stacks]
+    for arena_index, folded_stacks in enumerate(arena_stacks):
+        lines.extend(f"arena_{arena_index};{folded_stack} {count}" for folded_stack, count in folded_stacks)
+    return PlainTextResponse("\n".join(lines) + "\n")
+
+
 # normal client requests starts here
 
 class NormalClientData(BaseModel):
+    # the battleship fields are still accepted from older clients but never applied.
+    # battleships only move through the inputs sent to /sync and /stream
     client_name: str
     battleship_position: list[float] | None = Field(default=None, min_length=2, max_length=2)
     player_color: str
-    battleship_angle: float
-    battleship_velocity_magnitude: float
+    battleship_angle: float | None = None
+    battleship_velocity_magnitude: float | None = None
 
     def __str__(self):
         return f"{self.client_name} is at position {self.battleship_position}"
 
 
-
+# player data and shots are queued for the next tick and answered straight away. only players
+# unknown to the arena manager are turned down. player data only changes the player colour
 @app.post("/send_data")
 async def process_data_from_client(client_data: NormalClientData, player_name: str):
-    # for now client sends safe data and not pickled objects for server security
-    # pickled objects can contain malicious cose [WARNING]
-    operation_status = players_interface.update_player(client_data.client_name,
-                                                       {"battleship position": client_data.battleship_position,
-                                                         "color": client_data.player_color,
-                                                         "battleship_angle": client_data.battleship_angle,
-                                                         "battleship_velocity_magnitude": client_data.battleship_velocity_magnitude
-                                                       })
-    if operation_status:
+    # players only send data for themselves
+    if client_data.client_name != player_name:
+        return "player data does not belong to this player"
+    player_arena = arena_manager.get_arena(player_name)
+    if player_arena is not None:
+        player_arena.submit_command("update_player", client_data.model_dump())
         return "successfully sent player data"
     else:
         return "player does not exist. please create a new player"
-    pass
 
 @app.post("/shoot_bullet")
 async def shoot_bullet(player_name: str):
-    player = players_interface.get_player_by_name(player_name)
-    if player is not None:
-        player.world_battleship.shoot_bullet()
+    player_arena = arena_manager.get_arena(player_name)
+    if player_arena is not None:
+        player_arena.submit_command("shoot_bullet", player_name)
         return "successfully shot bullet"
     else:
         return "error while shooting bullet"
 
 
-# use this to send the player object to client. this returns a pickled byte object
+# use this to send the player object to client. this returns the player state in the binary wire format
 @app.get("/get_my_data")
 async def get_normal_client_self_data(player_name: str):
-    player_object = players_interface.get_player_by_name(player_name)
-    if player_object is not None:
-        player_object_bytes = pickle.dumps(player_object)
-        return Response(content=player_object_bytes, media_type="application/octet-stream")
+    player_state_bytes = await run_world_command(player_name, "get_player_state", player_name)
+    if player_state_bytes is not None:
+        return Response(content=player_state_bytes, media_type=BINARY_MEDIA_TYPE)
     else:
         return "player does not exist. please create a new player"
 
 
-# use this to send changed world data to client
-@app.get("/get_world_data")
-async def get_normal_client_world_data(player_name: str):
-    all_players = players_interface.get_all_players()
-    all_bullets = objects_interface.get_bullets(get_only_activated=True)
-
-    data_container = {}
-
-    # add data on opponent player positions and colors
-    opponent_player_data = {}
-    for p_o in all_players:
-        opponent_name = p_o.name
-        if opponent_name != player_name:
-            opponent_player_data[opponent_name] = {"name": opponent_name,
-                                                   "battleship_position": p_o.world_battleship.position,
-                                                   "color": p_o.color}
-    data_container["opponent_player_data"] =  opponent_player_data
-
-    # add data on world world_objects_data
-    bullets_data = []
-    for b_o in all_bullets:
-        bullets_data.append(b_o.position)
-    world_objects_data = {"bullets": bullets_data}
-    data_container["world_objects_data"] =  world_objects_data
-
-    # check if player is killed due to bullet collision. then return the same data for client to reflect it
-    client_player = players_interface.get_player_by_name(player_name)
-    killed_status = False
-    if client_player is None:
-        killed_status = True
-    data_container["your_data"] = {"killed": killed_status}
-
-    return data_container
+# use this to send changed world data to client.
+# clients that pass the last tick they received get only the changes since that tick
+async def build_world_data_response(player_name: str, last_tick: int | None, wire_format: WireFormat):
+    media_type = BINARY_MEDIA_TYPE if wire_format == "binary" else "application/json"
+    _, encoded_world_data = await wait_for_arena(
+        get_player_arena(player_name).request_world_data(player_name, last_tick, wire_format))
+    return Response(content=encoded_world_data, media_type=media_type)
+
 
+@app.get("/get_world_data")
+async def get_normal_client_world_data(player_name: str, last_tick: int | None = None,
+                                       wire_format: WireFormat = "json"):
+    return await build_world_data_response(player_name, last_tick, wire_format)
+
+
+# batched client contact. shots, player data and the world update in a single round trip
+class PlayerInput(BaseModel):
+    # one client frame worth of input. the server applies it at its next tick
+    sequence: int = Field(ge=1, le=MAX_INPUT_SEQUENCE)
+    thrust: int = Field(default=0, ge=-1, le=1)
+    rotate: int = Field(default=0, ge=-1, le=1)
+    shoot: bool = False
+
+
+class ClientSyncData(BaseModel):
+    player_data: NormalClientData | None = None
+    shots: int = Field(default=0, ge=0, le=10)
+    inputs: list[PlayerInput] = Field(default_factory=list, max_length=120)
+
+
+@app.post("/sync")
+async def sync_with_client(sync_data: ClientSyncData, player_name: str, last_tick: int = -1,
+                           wire_format: WireFormat = "json"):
+    # the changes are queued for the next tick without waiting for it. the response is the latest snapshot
+    player_arena = get_player_arena(player_name)
+    if sync_data.inputs:
+        player_arena.submit_command("queue_player_inputs", player_name,
+                                    [player_input.model_dump() for player_input in sync_data.inputs])
+    for _ in range(sync_data.shots):
+        player_arena.submit_command("shoot_bullet", player_name)
+    # player data for any other player is ignored
+    if sync_data.player_data is not None and sync_data.player_data.client_name == player_name:
+        player_arena.submit_command("update_player", sync_data.player_data.model_dump())
+    return await build_world_data_response(player_name, last_tick, wire_format)
+
+
+# streaming clients keep one websocket open for the whole game run.
+# the server pushes world updates at tick rate and the client pushes its player data and shots
+@app.websocket("/stream")
+async def stream_game_session(websocket: WebSocket, player_name: str, wire_format: WireFormat = "json"):
+    await websocket.accept()
+    player_arena = get_player_arena(player_name)
+
+    async def push_world_updates():
+        # the connection is reliable and ordered, so every update we sent counts as acknowledged
+        last_sent_tick = -1
+        try:
+            while True:
+                world_update = await wait_for_arena(
+                    player_arena.request_world_data(player_name, last_sent_tick, wire_format, only_if_newer=True))
+                if world_update is not None:
+                    last_sent_tick, encoded_world_data = world_update
+                    await websocket.send_bytes(encoded_world_data)
+                    stream_messages_sent.inc()
+                    stream_bytes_sent.inc(len(encoded_world_data))
+                await asyncio.sleep(1 / server_tick_rate)
+        except Exception as error:
+            # usually the client went away between two pushes. the receive loop notices it on its own
+            print(f"[WARNING] (STREAM) - Stopped pushing world updates to {player_name}: {error!r}")
+
+    push_task = asyncio.create_task(push_world_updates())
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+                message_type = message["type"]
+                if message_type == "send_data":
+                    # the socket was opened for player_name. the name in the message is not trusted
+                    client_data = NormalClientData(**message["data"]).model_dump()
+                    player_arena.submit_command("update_player", {**client_data, "client_name": player_name})
+                elif message_type == "shoot_bullet":
+                    player_arena.submit_command("shoot_bullet", player_name)
+                elif message_type == "inputs":
+                    player_arena.submit_command("queue_player_inputs", player_name,
+                                                [PlayerInput(**player_input).model_dump()
+                                                 for player_input in message["inputs"]])
+            except (ValueError, KeyError, TypeError, ValidationError):
+                # malformed messages are dropped, the stream stays open
+                continue
+    except WebSocketDisconnect:
+        pass
+    finally:
+        push_task.cancel()
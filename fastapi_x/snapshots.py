@@ -0,0 +1,281 @@
+import json
+import collections
+
+from game import ServerDataInterface, SpatialHash
+from protocol import encode_world_update
+
+
+#############################################################################
+
+# this starts the tick numbered world snapshots
+
+#############################################################################
+
+def encode_json(data):
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def overlay_your_data(encoded_world_data: bytes, your_data: dict):
+    # the only per client part of a world payload. it is spliced in front of the shared bytes,
+    # so the shared payload never has to be decoded or encoded again per client
+    return b'{"your_data":' + encode_json(your_data) + b"," + encoded_world_data[1:]
+
+
+class WorldSnapshot:
+    # the state of every entity clients care about, as of the end of a tick.
+    # a snapshot is never changed after capture, so it can be shared between all request handlers
+
+    # entities outside a view are counted on a grid of at most this many super cells a side, laid over the
+    # occupied cells. every view gets the same few entries, however many players the arena holds
+    distant_summary_grid_size = 8
+
+    def __init__(self, tick, players: dict, bullets: dict, player_states: dict | None = None,
+                 interest_cell_size=None, interest_cell_radius=1):
+        self.tick = tick
+        # player name -> {"name", "battleship_position", "color"}
+        self.players = players
+        # player name -> the full battleship state, sent only to the player itself for reconciliation
+        self.player_states = player_states if player_states is not None else {}
+        # bullet object id -> [x, y, velocity x, velocity y]. clients extrapolate bullets with the velocity
+        self.bullets = bullets
+
+        # area of interest. with an interest cell size, players are only sent the entities in the block of cells
+        # reaching interest_cell_radius cells out from their own cell, plus a count of everything further away.
+        # the grids hold player names and bullet ids, so a view costs the size of the block, not of the world
+        self.interest_cell_size = interest_cell_size
+        self.interest_cell_radius = interest_cell_radius
+        self.player_grid = self.bullet_grid = None
+        if interest_cell_size is not None:
+            self.player_grid, self.bullet_grid = SpatialHash(interest_cell_size), SpatialHash(interest_cell_size)
+            for player_name, player_data in players.items():
+                self.player_grid.insert(player_name, player_data["battleship_position"])
+            for bullet_id, bullet_data in bullets.items():
+                self.bullet_grid.insert(bullet_id, bullet_data)
+
+        # (first cell x, first cell y, cells per super cell x, y, super cell -> [players, bullets]),
+        # built on first use by get_summary_grid
+        self.summary_grid = None
+
+        # view cell -> (players, bullets, distant summary). the None view is the whole world
+        self.views: dict[tuple[int, int] | None, tuple[dict, dict, list]] = {}
+
+        # the full world payload per view, encoded once for all clients sharing the view. it includes
+        # every player in the view, clients drop their own entry from opponent_player_data
+        self.encoded_world_data: dict[tuple[int, int] | None, bytes] = {}
+        if interest_cell_size is None:
+            self.get_encoded_world_data()
+
+        # encoded updates against earlier ticks, built on first request.
+        # (wire format, (acknowledged tick, view cell then) or None, view cell now) -> bytes
+        self.encoded_updates: dict[tuple, bytes] = {}
+
+    @staticmethod
+    def capture(server_data_interface: ServerDataInterface, interest_cell_size=None, interest_cell_radius=1):
+        objects_interface = server_data_interface.world_to_objects_interface
+        players_interface = server_data_interface.world_to_players_interface
+
+        # positions are copied. compact world objects move their position lists in place
+        players, player_states = {}, {}
+        for player_o in players_interface.get_all_players():
+            battleship_o = player_o.world_battleship
+            battleship_position = list(battleship_o.position)
+            players[player_o.name] = {"name": player_o.name,
+                                      "battleship_position": battleship_position,
+                                      "color": player_o.color}
+            player_states[player_o.name] = {"last_processed_input": player_o.last_processed_input,
+                                            "battleship_position": battleship_position,
+                                            "battleship_angle": battleship_o.get_angle(),
+                                            "battleship_velocity_magnitude": battleship_o.get_velocity(),
+                                            "bullets_left": battleship_o.bullets_left}
+        bullets = {bullet_o.object_id: [*bullet_o.position, *bullet_o.velocity]
+                   for bullet_o in objects_interface.get_bullets(get_only_activated=True)}
+        return WorldSnapshot(objects_interface.current_tick, players, bullets, player_states,
+                             interest_cell_size, interest_cell_radius)
+
+    def get_player_cell(self, player_name):
+        # the view cell of the player. None without interest filtering and for players not in the world,
+        # who are sent the whole world
+        if self.player_grid is None or player_name not in self.players:
+            return None
+        return self.player_grid.get_cell(self.players[player_name]["battleship_position"])
+
+    def get_view(self, view_cell=None):
+        # the players and bullets seen from view_cell, and a summary of the occupied cells outside the view
+        view = self.views.get(view_cell)
+        if view is not None:
+            return view
+
+        if view_cell is None:
+            view = self.players, self.bullets, []
+        else:
+            players, bullets = self.players, self.bullets
+            view = ({player_name: players[player_name]
+                     for player_name in self.player_grid.query_cell_block(view_cell, self.interest_cell_radius)},
+                    {bullet_id: bullets[bullet_id]
+                     for bullet_id in self.bullet_grid.query_cell_block(view_cell, self.interest_cell_radius)},
+                    self.summarize_distant_cells(view_cell))
+        # views may be built on several threads at once. they come out the same, so the last one stays
+        self.views[view_cell] = view
+        return view
+
+    def get_summary_grid(self):
+        # counts every occupied cell into its super cell. once per snapshot, every view slices the result
+        summary_grid = self.summary_grid
+        if summary_grid is not None:
+            return summary_grid
+
+        player_cells, bullet_cells = self.player_grid.cells, self.bullet_grid.cells
+        occupied_cells = player_cells.keys() | bullet_cells.keys()
+        if not occupied_cells:
+            summary_grid = 0, 0, 1, 1, {}
+        else:
+            grid_size = self.distant_summary_grid_size
+            first_x, last_x = min(cell_x for cell_x, _ in occupied_cells), max(cell_x for cell_x, _ in occupied_cells)
+            first_y, last_y = min(cell_y for _, cell_y in occupied_cells), max(cell_y for _, cell_y in occupied_cells)
+            span_x, span_y = -(-(last_x - first_x + 1) // grid_size), -(-(last_y - first_y + 1) // grid_size)
+
+            super_cell_counts = {}
+            for cell in occupied_cells:
+                super_cell = (cell[0] - first_x) // span_x, (cell[1] - first_y) // span_y
+                counts = super_cell_counts.get(super_cell)
+                if counts is None:
+                    super_cell_counts[super_cell] = counts = [0, 0]
+                counts[0] += len(player_cells.get(cell, ()))
+                counts[1] += len(bullet_cells.get(cell, ()))
+            summary_grid = first_x, first_y, span_x, span_y, super_cell_counts
+        # like views, grids built on two threads at once come out the same
+        self.summary_grid = summary_grid
+        return summary_grid
+
+    def summarize_distant_cells(self, view_cell):
+        # [super cell center x, super cell center y, players, bullets] for every super cell with entities
+        # outside the view. the cells of the view are taken out of the super cells they fall in
+        first_x, first_y, span_x, span_y, super_cell_counts = self.get_summary_grid()
+        distant_counts = {super_cell: list(counts) for super_cell, counts in super_cell_counts.items()}
+
+        view_x, view_y = view_cell
+        cell_radius = self.interest_cell_radius
+        player_cells, bullet_cells = self.player_grid.cells, self.bullet_grid.cells
+        for cell_x in range(view_x - cell_radius, view_x + cell_radius + 1):
+            for cell_y in range(view_y - cell_radius, view_y + cell_radius + 1):
+                player_count = len(player_cells.get((cell_x, cell_y), ()))
+                bullet_count = len(bullet_cells.get((cell_x, cell_y), ()))
+                if player_count or bullet_count:
+                    counts = distant_counts[(cell_x - first_x) // span_x, (cell_y - first_y) // span_y]
+                    counts[0] -= player_count
+                    counts[1] -= bullet_count
+
+        cell_size = self.interest_cell_size
+        return [[(first_x + (super_x + 0.5) * span_x) * cell_size, (first_y + (super_y + 0.5) * span_y) * cell_size,
+                 player_count, bullet_count]
+                for (super_x, super_y), (player_count, bullet_count) in distant_counts.items()
+                if player_count or bullet_count]
+
+    def get_encoded_world_data(self, view_cell=None):
+        # the legacy full world payload, seen from view_cell
+        encoded_world_data = self.encoded_world_data.get(view_cell)
+        if encoded_world_data is None:
+            players, bullets, distant_summary = self.get_view(view_cell)
+            encoded_world_data = encode_json({"tick": self.tick,
+                                              "opponent_player_data": players,
+                                              "world_objects_data": {"bullets": [bullet_data[:2] for bullet_data
+                                                                                 in bullets.values()]},
+                                              "distant_summary": distant_summary})
+            self.encoded_world_data[view_cell] = encoded_world_data
+        return encoded_world_data
+
+
+def diff_entities(old_entities: dict, new_entities: dict):
+    # returns the entities that were added or changed, and the keys that were removed
+    changed = {key: value for key, value in new_entities.items() if old_entities.get(key) != value}
+    removed = [key for key in old_entities if key not in new_entities]
+    return changed, removed
+
+
+class SnapshotHistory:
+    # keeps the last few snapshots so that clients can be sent only what changed since the tick they acknowledged.
+    # clients get a full keyframe when their tick is unknown (too old or first contact)
+    # and once every keyframe_interval ticks, to repair any state they may have lost
+    def __init__(self, history_length=90, keyframe_interval=60):
+        self.keyframe_interval = keyframe_interval
+        self.snapshots: collections.OrderedDict[int, WorldSnapshot] = collections.OrderedDict()
+        self.history_length = history_length
+        self.latest_snapshot: WorldSnapshot | None = None
+
+    def record(self, snapshot: WorldSnapshot):
+        self.snapshots[snapshot.tick] = snapshot
+        while len(self.snapshots) > self.history_length:
+            self.snapshots.popitem(last=False)
+        self.latest_snapshot = snapshot
+
+    def get_snapshot(self, tick):
+        return self.snapshots.get(tick)
+
+    def is_keyframe_due(self, acknowledged_tick, current_tick):
+        return acknowledged_tick // self.keyframe_interval != current_tick // self.keyframe_interval
+
+    def get_base_snapshot(self, acknowledged_tick, latest_snapshot: WorldSnapshot):
+        # the snapshot an update is built against. None means a keyframe
+        if acknowledged_tick is None or self.is_keyframe_due(acknowledged_tick, latest_snapshot.tick):
+            return None
+        return self.get_snapshot(acknowledged_tick)
+
+    def get_update_key(self, acknowledged_tick, wire_format, latest_snapshot: WorldSnapshot, player_name=None):
+        # updates are shared by every client that acknowledged the same tick from the same view cell
+        # and looks from the same view cell now. returns the cache key, the base snapshot and both view cells
+        base_snapshot = self.get_base_snapshot(acknowledged_tick, latest_snapshot)
+        view_cell = latest_snapshot.get_player_cell(player_name)
+        if base_snapshot is None:
+            return (wire_format, None, view_cell), None, None, view_cell
+        base_view_cell = base_snapshot.get_player_cell(player_name)
+        return (wire_format, (base_snapshot.tick, base_view_cell), view_cell), base_snapshot, base_view_cell, view_cell
+
+    def is_update_encoded(self, acknowledged_tick=None, wire_format="json", latest_snapshot: WorldSnapshot | None = None,
+                          player_name=None):
+        # True if build_update would only look up bytes that are already encoded
+        if latest_snapshot is None:
+            latest_snapshot = self.latest_snapshot
+        update_key = self.get_update_key(acknowledged_tick, wire_format, latest_snapshot, player_name)[0]
+        return update_key in latest_snapshot.encoded_updates
+
+    def build_update(self, acknowledged_tick=None, wire_format="json", latest_snapshot: WorldSnapshot | None = None,
+                     player_name=None):
+        # the encoded world update since acknowledged_tick, either as json or in the binary wire format.
+        # it is the same for every client that shares the update key, so it is built once per tick and shared.
+        # opponents include the client itself. pass latest_snapshot to pin the update to a snapshot already in hand.
+        # with interest filtering the update only covers the player's view, and what changed in it is measured
+        # against the view the player had at acknowledged_tick, so entities leaving the view are removed
+        if latest_snapshot is None:
+            latest_snapshot = self.latest_snapshot
+        if latest_snapshot is None:
+            return None
+
+        update_key, base_snapshot, base_view_cell, view_cell = self.get_update_key(acknowledged_tick, wire_format,
+                                                                                   latest_snapshot, player_name)
+        encoded_update = latest_snapshot.encoded_updates.get(update_key)
+        if encoded_update is not None:
+            return encoded_update
+
+        players, bullets, distant_summary = latest_snapshot.get_view(view_cell)
+        if base_snapshot is None:
+            changed_players, removed_players = players, []
+            changed_bullets, removed_bullets = bullets, []
+        else:
+            base_players, base_bullets, _ = base_snapshot.get_view(base_view_cell)
+            changed_players, removed_players = diff_entities(base_players, players)
+            changed_bullets, removed_bullets = diff_entities(base_bullets, bullets)
+
+        if wire_format == "binary":
+            encoded_update = encode_world_update(latest_snapshot.tick, base_snapshot is None,
+                                                 changed_players, removed_players,
+                                                 changed_bullets, removed_bullets, distant_summary)
+        else:
+            encoded_update = encode_json({"tick": latest_snapshot.tick,
+                                          "keyframe": base_snapshot is None,
+                                          "opponent_player_data": changed_players,
+                                          "removed_opponents": removed_players,
+                                          "bullets": changed_bullets,
+                                          "removed_bullets": removed_bullets,
+                                          "distant_summary": distant_summary})
+        latest_snapshot.encoded_updates[update_key] = encoded_update
+        return encoded_update
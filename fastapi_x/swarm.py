@@ -0,0 +1,219 @@
+import json
+import time
+import asyncio
+import argparse
+
+import httpx
+
+from benchmark import print_table
+from bots import BotPilot
+from load_test import percentile
+from protocol import BINARY_MEDIA_TYPE, FLAG_KILLED, FLAGS_OFFSET, WORLD_UPDATE_HEADER
+
+
+#############################################################################
+
+# this starts the swarm bots. headless players that talk to the server like the game client does
+
+#############################################################################
+
+class SwarmStats:
+    # what all bots measured so far. stages are measured by the difference between two counts
+    def __init__(self):
+        self.round_trip_times_ms: list[float] = []
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.respawn_count = 0
+        self.error_count = 0
+
+    def get_counts(self):
+        return (len(self.round_trip_times_ms), self.bytes_received, self.bytes_sent,
+                self.respawn_count, self.error_count)
+
+
+class SwarmBot:
+    # one player. it sends its inputs and asks for the world updates since its last tick in one /sync request
+    # every sync_interval, like the game client's network worker. killed bots enter the game again
+    def __init__(self, http_client: httpx.AsyncClient, player_name, swarm_stats: SwarmStats,
+                 sync_interval=0.1, seed=None):
+        self.http_client = http_client
+        self.player_name = player_name
+        self.swarm_stats = swarm_stats
+        self.sync_interval = sync_interval
+        self.bot_pilot = BotPilot(seed=seed)
+
+        self.last_tick = -1
+        self.input_sequence = 0
+        self.in_game = False
+        self.stop_requested = False
+
+    async def enter(self):
+        # returns False when the server turns us down, because the arenas are full or the name is taken
+        response = await self.http_client.get("enter", params={"player_name": self.player_name,
+                                                               "player_color": "red"})
+        if not response.json().get("joined"):
+            return False
+        await self.http_client.get("get_my_data", params={"player_name": self.player_name})
+        self.last_tick = -1
+        return True
+
+    async def exit(self):
+        await self.http_client.get("exit", params={"player_name": self.player_name})
+
+    def next_inputs(self):
+        thrust, rotate, shoot = self.bot_pilot.next_input()
+        if not (thrust or rotate or shoot):
+            return []
+        self.input_sequence += 1
+        return [{"sequence": self.input_sequence, "thrust": thrust, "rotate": rotate, "shoot": shoot}]
+
+    async def sync(self):
+        # returns False once the server says we were killed
+        sync_data = json.dumps({"inputs": self.next_inputs()}).encode()
+        start_time = time.perf_counter()
+        response = await self.http_client.post("sync", content=sync_data,
+                                               headers={"content-type": "application/json"},
+                                               params={"player_name": self.player_name,
+                                                       "last_tick": self.last_tick, "wire_format": "binary"})
+        round_trip_time_ms = (time.perf_counter() - start_time) * 1000
+
+        swarm_stats = self.swarm_stats
+        swarm_stats.bytes_sent += len(sync_data)
+        swarm_stats.bytes_received += len(response.content)
+        if response.headers.get("content-type") != BINARY_MEDIA_TYPE:
+            swarm_stats.error_count += 1
+            return True
+        swarm_stats.round_trip_times_ms.append(round_trip_time_ms)
+
+        # the header is all a bot needs. decoding the whole update would load the swarm, not the server
+        self.last_tick = WORLD_UPDATE_HEADER.unpack_from(response.content, 0)[3]
+        return not response.content[FLAGS_OFFSET] & FLAG_KILLED
+
+    async def run(self):
+        # bots that could not join, or were killed, try to enter again at their next sync
+        while not self.stop_requested:
+            next_sync_time = time.perf_counter() + self.sync_interval
+            try:
+                if not self.in_game:
+                    self.in_game = await self.enter()
+                    if not self.in_game:
+                        self.swarm_stats.error_count += 1
+                elif not await self.sync():
+                    self.swarm_stats.respawn_count += 1
+                    self.in_game = False
+                    await self.exit()
+            except (httpx.HTTPError, ValueError):
+                self.swarm_stats.error_count += 1
+            await asyncio.sleep(max(next_sync_time - time.perf_counter(), 0))
+        if self.in_game:
+            try:
+                await self.exit()
+            except httpx.HTTPError:
+                self.swarm_stats.error_count += 1
+
+
+#############################################################################
+
+# this starts the swarm runner
+
+#############################################################################
+
+async def get_arena_tick_counts(http_client: httpx.AsyncClient):
+    # world tick, overruns, ticks timed and their total duration, for every arena
+    tick_stats = (await http_client.get("tick_stats")).json()
+    return [(arena_stats["world_tick"], arena_stats["overrun_count"], arena_stats["tick_duration_ms"]["count"],
+             arena_stats["tick_duration_ms"]["count"] * arena_stats["tick_duration_ms"]["mean"])
+            for arena_stats in tick_stats["arenas"]]
+
+
+class BotSwarm:
+    # grows the swarm stage by stage and reports, for every stage, the round trip times the bots saw,
+    # the traffic, and the tick rate the server kept up with that many players
+    def __init__(self, http_client: httpx.AsyncClient, sync_rate=10, join_rate=50, seed=0):
+        self.http_client = http_client
+        self.sync_interval = 1 / sync_rate
+        self.join_interval = 1 / join_rate
+        self.seed = seed
+        self.swarm_stats = SwarmStats()
+        self.bots: list[SwarmBot] = []
+        self.bot_tasks: list[asyncio.Task] = []
+
+    async def grow(self, player_count):
+        # bots join at join_rate, so the server is not measured during a join storm
+        while len(self.bots) < player_count:
+            bot = SwarmBot(self.http_client, f"bot_{len(self.bots)}", self.swarm_stats, self.sync_interval,
+                           seed=self.seed + len(self.bots))
+            self.bots.append(bot)
+            self.bot_tasks.append(asyncio.create_task(bot.run()))
+            await asyncio.sleep(self.join_interval)
+
+    async def measure_stage(self, stage_seconds, target_tick_rate):
+        start_counts, start_time = self.swarm_stats.get_counts(), time.perf_counter()
+        start_arena_counts = await get_arena_tick_counts(self.http_client)
+        await asyncio.sleep(stage_seconds)
+        end_arena_counts = await get_arena_tick_counts(self.http_client)
+        end_counts, elapsed_time = self.swarm_stats.get_counts(), time.perf_counter() - start_time
+
+        rtt_count, bytes_received, bytes_sent, respawn_count, error_count = (
+            end_count - start_count for start_count, end_count in zip(start_counts, end_counts))
+        round_trip_times_ms = sorted(self.swarm_stats.round_trip_times_ms[start_counts[0]:end_counts[0]])
+
+        # the slowest arena sets the tick rate its players get
+        arena_count_changes = [[end_count - start_count for start_count, end_count in zip(start_arena, end_arena)]
+                               for start_arena, end_arena in zip(start_arena_counts, end_arena_counts)]
+        tick_rate = min(ticks for ticks, _, _, _ in arena_count_changes) / elapsed_time
+        # bots that are in the game right now. the others were turned down or are joining again
+        return {"bots": len(self.bots),
+                "players": sum(bot.in_game for bot in self.bots),
+                "syncs": rtt_count,
+                "rtt_p50_ms": percentile(round_trip_times_ms, 0.50),
+                "rtt_p95_ms": percentile(round_trip_times_ms, 0.95),
+                "rtt_p99_ms": percentile(round_trip_times_ms, 0.99),
+                "down_kb_s": bytes_received / elapsed_time / 1024,
+                "up_kb_s": bytes_sent / elapsed_time / 1024,
+                "tick_rate": tick_rate,
+                "tick_rate_pct": 100 * tick_rate / target_tick_rate,
+                "tick_ms": max(tick_duration_ms / timed_ticks if timed_ticks else 0.0
+                               for _, _, timed_ticks, tick_duration_ms in arena_count_changes),
+                "overruns": sum(overruns for _, overruns, _, _ in arena_count_changes),
+                "respawns": respawn_count,
+                "errors": error_count}
+
+    async def run(self, player_stages, stage_seconds=5.0):
+        target_tick_rate = (await self.http_client.get("tick_stats")).json()["tick_rate"]
+        results = []
+        try:
+            for player_count in player_stages:
+                await self.grow(player_count)
+                results.append(await self.measure_stage(stage_seconds, target_tick_rate))
+        finally:
+            for bot in self.bots:
+                bot.stop_requested = True
+            await asyncio.gather(*self.bot_tasks, return_exceptions=True)
+        return results
+
+
+async def run_swarm(server_url, player_stages, stage_seconds, sync_rate, join_rate, seed):
+    limits = httpx.Limits(max_connections=max(player_stages))
+    async with httpx.AsyncClient(base_url=server_url, limits=limits, timeout=30) as http_client:
+        bot_swarm = BotSwarm(http_client, sync_rate, join_rate, seed)
+        return await bot_swarm.run(player_stages, stage_seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play a running server with a swarm of headless bots "
+                                                 "and report how it holds up as the swarm grows")
+    parser.add_argument("--server-url", default="http://127.0.0.1:8000/")
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 50, 100, 200],
+                        help="swarm size of each stage")
+    parser.add_argument("--stage-seconds", type=float, default=5.0, help="seconds measured at each swarm size")
+    parser.add_argument("--sync-rate", type=float, default=10, help="/sync requests per second per bot")
+    parser.add_argument("--join-rate", type=float, default=50, help="bots joining per second between stages")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random bot inputs")
+    args = parser.parse_args()
+
+    results_v = asyncio.run(run_swarm(args.server_url, args.players, args.stage_seconds, args.sync_rate,
+                                      args.join_rate, args.seed))
+    print(f"[INFO] (SWARM) - {args.stage_seconds:.0f} s per stage, {args.sync_rate:.0f} syncs per second per bot")
+    print_table(results_v, ["bots", "players", "syncs", "rtt_p50_ms", "rtt_p95_ms", "rtt_p99_ms", "down_kb_s", "up_kb_s",
+                            "tick_rate", "tick_rate_pct", "tick_ms", "overruns", "respawns", "errors"])
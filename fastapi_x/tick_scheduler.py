@@ -0,0 +1,86 @@
+import time
+import threading
+import traceback
+
+from metrics import Histogram
+
+
+#############################################################################
+
+# this starts the fixed timestep tick scheduler
+
+#############################################################################
+
+class TickScheduler:
+    # runs tick_function at a fixed rate. wall clock time is collected in an accumulator and paid out in whole ticks,
+    # so the simulation always advances by the same step. when ticks overrun, up to max_catch_up_ticks are run
+    # back to back to catch up. anything beyond that is dropped and counted, instead of stalling the world forever.
+    # a tick that raises is logged and counted, the scheduler goes on with the next one
+    def __init__(self, tick_function, tick_rate=30, max_catch_up_ticks=5):
+        self.tick_function = tick_function
+        self.tick_rate = tick_rate
+        self.tick_interval = 1 / tick_rate
+        self.max_catch_up_ticks = max_catch_up_ticks
+
+        # telemetry
+        self.tick_count = 0
+        self.overrun_count = 0
+        self.dropped_tick_count = 0
+        self.failed_tick_count = 0
+        self.tick_duration_ms = Histogram([1, 2, 5, 10, 20, 33, 50, 100, 250])
+
+        self._stop_event = threading.Event()
+
+    def run_tick(self):
+        tick_start_time = time.perf_counter()
+        try:
+            self.tick_function()
+        except Exception:
+            self.failed_tick_count += 1
+            print(f"[ERROR] (TICK) - tick {self.tick_count} failed")
+            traceback.print_exc()
+        tick_duration = time.perf_counter() - tick_start_time
+
+        self.tick_count += 1
+        self.tick_duration_ms.observe(tick_duration * 1000)
+        if tick_duration > self.tick_interval:
+            self.overrun_count += 1
+
+    def run(self):
+        tick_interval = self.tick_interval
+        accumulator = 0.0
+        previous_time = time.monotonic()
+        while not self._stop_event.is_set():
+            current_time = time.monotonic()
+            accumulator += current_time - previous_time
+            previous_time = current_time
+
+            ticks_run = 0
+            while accumulator >= tick_interval and ticks_run < self.max_catch_up_ticks:
+                self.run_tick()
+                accumulator -= tick_interval
+                ticks_run += 1
+
+            # still behind after catching up. drop the backlog so the world does not spiral
+            if accumulator >= tick_interval:
+                ticks_behind = int(accumulator // tick_interval)
+                self.dropped_tick_count += ticks_behind
+                accumulator -= ticks_behind * tick_interval
+
+            time.sleep(max(tick_interval - accumulator, 0))
+
+    def start(self):
+        scheduler_thread = threading.Thread(target=self.run, daemon=True)
+        scheduler_thread.start()
+        return scheduler_thread
+
+    def stop(self):
+        self._stop_event.set()
+
+    def get_stats(self):
+        return {"tick_rate": self.tick_rate,
+                "tick_count": self.tick_count,
+                "overrun_count": self.overrun_count,
+                "dropped_tick_count": self.dropped_tick_count,
+                "failed_tick_count": self.failed_tick_count,
+                "tick_duration_ms": self.tick_duration_ms.to_dict()}
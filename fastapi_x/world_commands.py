@@ -0,0 +1,69 @@
+import collections
+import concurrent.futures
+
+
+#############################################################################
+
+# this starts the command queue between request handlers and the simulation thread
+
+#############################################################################
+
+class WorldCommandQueue:
+    # request handlers never change the world themselves. they submit commands, and the simulation thread
+    # applies them between ticks, so the world only ever has one writer.
+    # every command gets a future. it is resolved once the tick that applied the command has been snapshotted,
+    # so a handler that waits on it will find the change in the latest snapshot
+    def __init__(self):
+        # appends and pops on a deque are atomic, no lock needed between handlers and the simulation thread
+        self.pending_commands: collections.deque = collections.deque()
+        self.applied_command_count = 0
+        self.failed_command_count = 0
+
+    def submit(self, command, *args) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        self.pending_commands.append((command, args, future))
+        return future
+
+    def apply_pending(self):
+        # runs on the simulation thread. commands submitted while this runs wait for the next tick.
+        # a failing command fails its own future and never the tick
+        completed_commands = []
+        for _ in range(len(self.pending_commands)):
+            command, args, future = self.pending_commands.popleft()
+            # handlers that gave up waiting cancel their future. their command is dropped, not applied
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                completed_commands.append((future, command(*args), None))
+            except Exception as error:
+                completed_commands.append((future, None, error))
+                self.failed_command_count += 1
+        self.applied_command_count += len(completed_commands)
+        return completed_commands
+
+    @staticmethod
+    def resolve(completed_commands):
+        for future, result, error in completed_commands:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def fail_pending(self, error):
+        # runs on the simulation thread after a failed tick. commands still waiting are dropped
+        # and their futures failed, so no handler waits on a tick that may never come
+        failed_commands = []
+        for _ in range(len(self.pending_commands)):
+            _, _, future = self.pending_commands.popleft()
+            if future.set_running_or_notify_cancel():
+                failed_commands.append((future, None, error))
+        self.failed_command_count += len(failed_commands)
+        self.resolve(failed_commands)
+
+    def get_stats(self):
+        return {"pending": len(self.pending_commands),
+                "applied": self.applied_command_count,
+                "failed": self.failed_command_count}
+
+    def __len__(self):
+        return len(self.pending_commands)
@@ -0,0 +1,279 @@
+import numpy as np
+
+from game import WorldToObjectsInterface, WorldBullet, WorldBattleship, ServerWorld, ANGLE_STEP, UNIT_VECTORS_BY_ANGLE
+
+
+#############################################################################
+
+# this starts the struct-of-arrays storage for world objects
+
+#############################################################################
+
+class EntityArrays:
+    # keeps one column per attribute for every entity of a kind, so that a tick can move all of them at once.
+    # entities own a slot (a row index) for their lifetime. freed slots are reused
+    def __init__(self, columns: dict, capacity=64):
+        # columns maps name -> (width, fill value). width 1 columns are stored flat
+        self.columns = columns
+        self.capacity = capacity
+        for column_name, (width, fill_value) in columns.items():
+            shape = (capacity,) if width == 1 else (capacity, width)
+            setattr(self, column_name, np.full(shape, fill_value, dtype=np.float64))
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.owners: list = [None] * capacity
+        self.free_slots = list(range(capacity - 1, -1, -1))
+
+    def grow(self):
+        old_capacity, new_capacity = self.capacity, self.capacity * 2
+        for column_name, (width, fill_value) in self.columns.items():
+            old_column = getattr(self, column_name)
+            shape = (new_capacity,) if width == 1 else (new_capacity, width)
+            new_column = np.full(shape, fill_value, dtype=np.float64)
+            new_column[:old_capacity] = old_column
+            setattr(self, column_name, new_column)
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:old_capacity] = self.alive
+        self.alive = alive
+        self.owners.extend([None] * (new_capacity - old_capacity))
+        self.free_slots.extend(range(new_capacity - 1, old_capacity - 1, -1))
+        self.capacity = new_capacity
+
+    def allocate(self, owner):
+        if not self.free_slots:
+            self.grow()
+        slot = self.free_slots.pop()
+        for column_name, (_, fill_value) in self.columns.items():
+            getattr(self, column_name)[slot] = fill_value
+        self.alive[slot] = True
+        self.owners[slot] = owner
+        return slot
+
+    def release(self, slot):
+        self.alive[slot] = False
+        self.owners[slot] = None
+        self.free_slots.append(slot)
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+
+# the unit vectors of the rotation steps, indexed by angle // ANGLE_STEP
+UNIT_COS = np.array([cos_angle for cos_angle, _ in UNIT_VECTORS_BY_ANGLE.values()])
+UNIT_SIN = np.array([sin_angle for _, sin_angle in UNIT_VECTORS_BY_ANGLE.values()])
+
+
+def get_unit_vectors(angles):
+    # batched get_unit_vector. angles on the rotation steps come from the table, the rest are computed
+    angles = angles % 360
+    steps = angles / ANGLE_STEP
+    on_step = steps == np.floor(steps)
+    step_indices = np.where(on_step, steps, 0).astype(np.intp)
+    radians = np.radians(angles)
+    return (np.where(on_step, UNIT_COS[step_indices], np.cos(radians)),
+            np.where(on_step, UNIT_SIN[step_indices], np.sin(radians)))
+
+
+class ArrayColumn:
+    # exposes one column of an entity's slot as a plain attribute, so the game object code works unchanged.
+    # vectors are handed out as lists (json friendly), missing values are stored as nan and read back as None
+    def __init__(self, column_name, is_vector=False):
+        self.column_name = column_name
+        self.is_vector = is_vector
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = getattr(instance.store, self.column_name)[instance.slot]
+        if self.is_vector:
+            return None if np.isnan(value[0]) else value.tolist()
+        value = float(value)
+        return None if value != value else value
+
+    def __set__(self, instance, value):
+        getattr(instance.store, self.column_name)[instance.slot] = np.nan if value is None else value
+
+
+class ArrayBooleanColumn(ArrayColumn):
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return bool(getattr(instance.store, self.column_name)[instance.slot])
+
+
+#############################################################################
+
+# this starts the array backed world objects
+
+#############################################################################
+
+class ArrayWorldBullet(WorldBullet):
+    position = ArrayColumn("position", is_vector=True)
+    velocity = ArrayColumn("velocity", is_vector=True)
+    activated = ArrayBooleanColumn("activated")
+    activation_time = ArrayColumn("activation_time")
+    activation_tick = ArrayColumn("activation_tick")
+
+    def __init__(self, world_interface: "ArrayWorldToObjectsInterface", velocity=None, name_extended=""):
+        # the slot has to exist before the base classes assign any attributes
+        self.store = world_interface.bullet_arrays
+        self.slot = self.store.allocate(self)
+        super().__init__(world_interface, velocity=velocity, name_extended=name_extended)
+
+    def __del__(self):
+        super().__del__()
+        if self.slot is not None:
+            self.store.release(self.slot)
+            self.slot = None
+
+
+class ArrayWorldBattleship(WorldBattleship):
+    position = ArrayColumn("position", is_vector=True)
+    angle = ArrayColumn("angle")
+    _natural_deceleration = ArrayColumn("natural_deceleration")
+    _max_velocity_magnitude = ArrayColumn("max_velocity_magnitude")
+    _velocity_magnitude = ArrayColumn("velocity_magnitude")
+    _velocity_components = ArrayColumn("velocity_components", is_vector=True)
+    _velocity_components_angle = ArrayColumn("velocity_components_angle")
+
+    def __init__(self, world_interface: "ArrayWorldToObjectsInterface", name_extended=""):
+        self.store = world_interface.battleship_arrays
+        self.slot = self.store.allocate(self)
+        super().__init__(world_interface, name_extended=name_extended)
+
+    def __del__(self):
+        super().__del__()
+        if self.slot is not None:
+            self.store.release(self.slot)
+            self.slot = None
+
+
+class ArrayWorldToObjectsInterface(WorldToObjectsInterface):
+    def __init__(self, initial_capacity=64):
+        super().__init__()
+        self.bullet_arrays = EntityArrays({"position": (2, np.nan),
+                                           "velocity": (2, 0.0),
+                                           "activated": (1, 0.0),
+                                           "activation_time": (1, np.nan),
+                                           "activation_tick": (1, np.nan)},
+                                          capacity=initial_capacity * 10)
+        self.battleship_arrays = EntityArrays({"position": (2, np.nan),
+                                               "angle": (1, 0.0),
+                                               "natural_deceleration": (1, 0.0),
+                                               "max_velocity_magnitude": (1, 0.0),
+                                               "velocity_magnitude": (1, 0.0),
+                                               "velocity_components": (2, 0.0),
+                                               "velocity_components_angle": (1, np.nan)},
+                                              capacity=initial_capacity)
+
+    def make_bullet(self, name_extended=""):
+        return ArrayWorldBullet(world_interface=self, name_extended=name_extended)
+
+    def make_battleship(self, name_extended=""):
+        return ArrayWorldBattleship(self, name_extended)
+
+    def move_bullets(self):
+        bullets = self.bullet_arrays
+        moving = bullets.alive & (bullets.activated != 0)
+        bullets.position[moving] += bullets.velocity[moving]
+
+    def move_battleships(self):
+        # mirrors Battleship.move for every battleship at once
+        ships = self.battleship_arrays
+        alive = ships.alive
+
+        # slow down the players naturally. velocity changes beyond the max magnitude are ignored.
+        # only ships whose magnitude or angle changed get their velocity components recomputed
+        new_magnitude = np.abs(ships.velocity_magnitude) - ships.natural_deceleration
+        changed = alive & ((new_magnitude != ships.velocity_magnitude)
+                           | (ships.angle != ships.velocity_components_angle))
+        changed &= np.abs(new_magnitude) <= ships.max_velocity_magnitude
+        if changed.any():
+            cos_angles, sin_angles = get_unit_vectors(ships.angle[changed])
+            ships.velocity_magnitude[changed] = np.round(new_magnitude[changed], 2)
+            ships.velocity_components[changed, 0] = np.round(new_magnitude[changed] * cos_angles, 2)
+            ships.velocity_components[changed, 1] = np.round(new_magnitude[changed] * sin_angles, 2)
+            ships.velocity_components_angle[changed] = ships.angle[changed]
+
+        ships.position[alive] += ships.velocity_components[alive]
+
+
+#############################################################################
+
+# this starts the vectorized server world
+
+#############################################################################
+
+class ArrayServerWorld(ServerWorld):
+    # runs movement and collision as whole array operations.
+    # use it together with a ServerDataInterface built on ArrayWorldToObjectsInterface
+
+    # the batched form of the spatial hash. cells are packed into one int64 key, x in the high 32 bits
+    cell_key_offset = 1 << 31
+    neighbour_offsets_x, neighbour_offsets_y = (offsets.ravel() for offsets in np.mgrid[-1:2, -1:2])
+
+    def update_objects(self):
+        objects_interface_v = self.server_data_interface.world_to_objects_interface
+        objects_interface_v.move_bullets()
+        objects_interface_v.move_battleships()
+
+    def find_spent_bullets(self, all_bullets, current_tick):
+        bullets = self.server_data_interface.world_to_objects_interface.bullet_arrays
+        arena_width, arena_height = self.arena_size
+
+        spent = bullets.alive & (bullets.activated != 0)
+        spent &= ((current_tick - bullets.activation_tick >= self.seconds_to_ticks(self.max_bullet_lifetime))
+                  | (bullets.position[:, 0] < 0) | (bullets.position[:, 0] > arena_width)
+                  | (bullets.position[:, 1] < 0) | (bullets.position[:, 1] > arena_height))
+        return [bullets.owners[slot] for slot in np.flatnonzero(spent)]
+
+    def get_cell_keys(self, cells_x, cells_y):
+        return (cells_x << 32) + (cells_y + self.cell_key_offset)
+
+    def find_collisions(self, all_players, all_bullets, current_tick):
+        objects_interface_v = self.server_data_interface.world_to_objects_interface
+        bullets, ships = objects_interface_v.bullet_arrays, objects_interface_v.battleship_arrays
+        if not all_players:
+            return [], []
+
+        # check if min time has elapsed after bullet activation.
+        # this is to prevent collision registering with player who shoots it
+        min_ticks_to_elapse_for_bullet = self.seconds_to_ticks(0.3)
+        eligible = bullets.alive & (bullets.activated != 0)
+        eligible &= (current_tick - bullets.activation_tick) >= min_ticks_to_elapse_for_bullet
+        bullet_slots = np.flatnonzero(eligible)
+        if bullet_slots.size == 0:
+            return [], []
+
+        ship_slots = np.fromiter((player_p.world_battleship.slot for player_p in all_players),
+                                 dtype=np.intp, count=len(all_players))
+        player_positions = ships.position[ship_slots]
+        bullet_positions = bullets.position[bullet_slots]
+
+        # sort the players by cell, like the player grid of ServerWorld. every bullet then looks up its own cell
+        # and the 8 around it with a binary search, and only the players found there are measured
+        cell_size = self.collision_radius
+        player_cells = np.floor_divide(player_positions, cell_size).astype(np.int64)
+        player_keys = self.get_cell_keys(player_cells[:, 0], player_cells[:, 1])
+        player_order = np.argsort(player_keys, kind="stable")
+        sorted_player_keys = player_keys[player_order]
+
+        bullet_cells = np.floor_divide(bullet_positions, cell_size).astype(np.int64)
+        neighbour_keys = self.get_cell_keys(bullet_cells[:, 0, None] + self.neighbour_offsets_x,
+                                            bullet_cells[:, 1, None] + self.neighbour_offsets_y).ravel()
+        first_matches = np.searchsorted(sorted_player_keys, neighbour_keys, side="left")
+        match_counts = np.searchsorted(sorted_player_keys, neighbour_keys, side="right") - first_matches
+        candidate_count = int(match_counts.sum())
+        if candidate_count == 0:
+            return [], []
+
+        # one row per (bullet, player in a neighbouring cell) pair
+        candidate_bullets = np.repeat(np.arange(neighbour_keys.size) // self.neighbour_offsets_x.size, match_counts)
+        match_starts = np.cumsum(match_counts) - match_counts
+        candidate_players = player_order[np.repeat(first_matches - match_starts, match_counts)
+                                         + np.arange(candidate_count)]
+
+        offsets = bullet_positions[candidate_bullets] - player_positions[candidate_players]
+        within_reach = np.einsum("ij,ij->i", offsets, offsets) <= self.collision_radius * self.collision_radius
+        bullets_hit = [bullets.owners[slot] for slot in bullet_slots[np.unique(candidate_bullets[within_reach])]]
+        players_hit = [all_players[player_index] for player_index in np.unique(candidate_players[within_reach])]
+        return bullets_hit, players_hit